@@ -2,11 +2,13 @@ import streamlit as st
 import os
 from dotenv import load_dotenv
 from image_processor import ImageProcessor
-import json
+from log_setup import configure_logging
+import json_utils
 from datetime import datetime
 
 # Load environment variables
 load_dotenv()
+configure_logging()
 
 # Page configuration
 st.set_page_config(
@@ -15,6 +17,62 @@ st.set_page_config(
     layout="wide"
 )
 
+# Default analysis prompt shown in the sidebar
+_DEFAULT_PROMPT = "Dynamic Universal Image Analysis Prompt\n\nSystem Role:\nYou are an advanced multimodal AI trained to perform exhaustive image analysis with maximum depth, precision, and creativity. Your job is not just to describe, but to extract, interpret, cross-reference, and contextualize every possible detail from an image.\n\nAnalyze the input image step by step and provide the most comprehensive extraction possible. Follow this layered approach:\n\n1. Raw Text Extraction (OCR++)\n2. Object & Scene Recognition\nn3. People & Identity Clues\n4. Event / Situation Context\n5. Brand / Logo / Product Detection\n6. Colors, Style & Aesthetic\n7. Internet / Cultural Cross-Reference\n8. Metadata & Hidden Clues\n9. Contextual Reasoning\n10. Rich Human-Friendly Summary\n\nPlease be comprehensive and provide as much detail as possible."
+
+@st.cache_resource(show_spinner=False)
+def get_processor(api_key):
+    """Build the ImageProcessor once and reuse it across reruns."""
+    return ImageProcessor(api_key)
+
+# Every save bumps the mtime key, and only the current listing is ever read again
+@st.cache_data(show_spinner=False, max_entries=4)
+def _load_history(_processor, output_dir, mtime_ns):
+    """
+    Load processing history, cached per output dir mtime.
+    
+    Args:
+        _processor: ImageProcessor instance (not hashed by Streamlit)
+        output_dir: Directory holding the JSON results
+        mtime_ns: Modification time of output_dir, used as the cache key
+        
+    Returns:
+        History list from ImageProcessor.get_processing_history
+    """
+    return _processor.get_processing_history()
+
+# Keyed per file mtime, so rewritten files would otherwise keep their stale entries forever
+@st.cache_data(show_spinner=False, max_entries=64)
+def _load_preview(filepath, mtime_ns):
+    """
+    Parse a single result JSON, cached per file mtime.
+    
+    Args:
+        filepath: Path to the result JSON file
+        mtime_ns: Modification time of the file, used as the cache key
+        
+    Returns:
+        Parsed JSON data
+    """
+    return json_utils.load_file(filepath)
+
+# Only recent uploads are likely to be shown again
+@st.cache_data(show_spinner=False, max_entries=32)
+def _load_thumbnail(_processor, file_id, _image_bytes):
+    """
+    Downscale an upload for display, cached per uploaded file.
+    
+    Args:
+        _processor: ImageProcessor to downscale with (not hashed)
+        file_id: Streamlit's ID for the uploaded file, used as the cache key
+        _image_bytes: Raw contents of the uploaded file (not hashed)
+        
+    Returns:
+        Encoded preview image bytes
+    """
+    preview_bytes, _ = _processor.downscale_image_bytes(_image_bytes, max_edge=800)
+    return preview_bytes
+
 def main():
     st.title("🖼️ Image Context Analyzer with Gemini ")
     st.markdown("Upload an image and get detailed context analysis using Google's Gemini AI model")
@@ -29,7 +87,7 @@ def main():
     
     # Initialize processor
     try:
-        processor = ImageProcessor(api_key)
+        processor = get_processor(api_key)
         st.success("✅ Gemini API connected successfully!")
     except Exception as e:
         st.error(f"❌ Failed to initialize Gemini API: {str(e)}")
@@ -48,13 +106,22 @@ def main():
         st.sidebar.info("Check your ImageKit credentials in .env file")
     
     # Custom prompt input
+    if "prompt" not in st.session_state:
+        st.session_state["prompt"] = _DEFAULT_PROMPT
     custom_prompt = st.sidebar.text_area(
         "Custom Analysis Prompt (Optional)",
-        value="Dynamic Universal Image Analysis Prompt\n\nSystem Role:\nYou are an advanced multimodal AI trained to perform exhaustive image analysis with maximum depth, precision, and creativity. Your job is not just to describe, but to extract, interpret, cross-reference, and contextualize every possible detail from an image.\n\nAnalyze the input image step by step and provide the most comprehensive extraction possible. Follow this layered approach:\n\n1. Raw Text Extraction (OCR++)\n2. Object & Scene Recognition\nn3. People & Identity Clues\n4. Event / Situation Context\n5. Brand / Logo / Product Detection\n6. Colors, Style & Aesthetic\n7. Internet / Cultural Cross-Reference\n8. Metadata & Hidden Clues\n9. Contextual Reasoning\n10. Rich Human-Friendly Summary\n\nPlease be comprehensive and provide as much detail as possible.",
+        key="prompt",
         height=200,
         help="Customize how Gemini analyzes your image"
     )
     
+    # Downscale toggle
+    auto_downscale = st.sidebar.checkbox(
+        "Auto-downscale large images",
+        value=True,
+        help="Shrink images to fit Gemini's input resolution before sending (faster, fewer tokens)"
+    )
+    
     # Custom filename input
     custom_filename = st.sidebar.text_input(
         "Custom JSON Filename (Optional)",
@@ -76,73 +143,74 @@ def main():
         )
         
         if uploaded_file is not None:
-            # Display uploaded image
-            st.image(uploaded_file, caption="Uploaded Image", use_column_width=True)
+            # Display a small preview; the original bytes are still used for analysis
+            preview_bytes = _load_thumbnail(processor, uploaded_file.file_id, uploaded_file.getvalue())
+            st.image(preview_bytes, caption="Uploaded Image", use_column_width=True)
             
             # Process button
             if st.button("🚀 Process Image with Gemini", type="primary"):
                 with st.spinner("Processing image with Gemini 2.5 Pro..."):
                     try:
-                        # Save uploaded file temporarily
-                        temp_path = f"temp_{uploaded_file.name}"
-                        with open(temp_path, "wb") as f:
-                            f.write(uploaded_file.getbuffer())
+                        # Keep the upload in memory instead of round-tripping through a temp file.
+                        # UploadedFile is BytesIO-backed, so getvalue() shares its buffer rather than copying it.
+                        image_bytes = uploaded_file.getvalue()
+                        mime_type = uploaded_file.type
+                        
+                        # Stream the analysis into the page as it arrives; only the copy sent to
+                        # Gemini is downscaled, the result and ImageKit upload keep the original
+                        placeholder = st.empty()
+                        context = ""
+                        for chunk in processor.process_image_stream(uploaded_file.name, custom_prompt, image_bytes=image_bytes,
+                                                                    mime_type=mime_type, downscale=auto_downscale):
+                            context += chunk
+                            placeholder.markdown(context)
                         
-                        # Process image
-                        result = processor.process_image(temp_path, custom_prompt)
+                        # A failed stream raises into the except below, so build_result only sees complete analyses
+                        result = processor.build_result(uploaded_file.name, context, custom_prompt, image_bytes=image_bytes)
                         
                         # Save to JSON
-                        if result["processing_status"] == "success":
-                            json_path = processor.save_to_json(result, custom_filename)
-                            
-                            # Clean up temp file
-                            os.remove(temp_path)
-                            
-                            st.success(f"✅ Image processed successfully!")
-                            st.info(f"📁 JSON saved to: {json_path}")
-                            
-                            # Display results
-                            st.subheader("📊 Analysis Results")
-                            
-                            # Show ImageKit status if available
-                            if 'imagekit' in result and result['imagekit']:
-                                if result['imagekit'].get('success'):
-                                    st.success("☁️ Image successfully uploaded to ImageKit!")
-                                    st.info(f"**ImageKit URL:** [View Image]({result['imagekit']['imagekit_url']})")
-                                    st.info(f"**ImageKit ID:** {result['imagekit']['imagekit_id']}")
-                                    
-                                    # Display the uploaded image from ImageKit
-                                    st.image(result['imagekit']['imagekit_url'], caption="Image stored in ImageKit", use_column_width=True)
-                                else:
-                                    st.error(f"❌ ImageKit upload failed: {result['imagekit'].get('error', 'Unknown error')}")
-                            
-                            st.json(result)
-                            
-                            # Download button for JSON
-                            with open(json_path, 'r', encoding='utf-8') as f:
-                                json_content = f.read()
-                            
-                            st.download_button(
-                                label="📥 Download JSON",
-                                data=json_content,
-                                file_name=os.path.basename(json_path),
-                                mime="application/json"
-                            )
-                        else:
-                            st.error(f"❌ Processing failed: {result.get('error', 'Unknown error')}")
-                            os.remove(temp_path)
-                            
+                        json_path, json_content = processor.save_to_json_with_payload(result, custom_filename)
+                        
+                        st.success(f"✅ Image processed successfully!")
+                        st.info(f"📁 JSON saved to: {json_path}")
+                        
+                        # Display results
+                        st.subheader("📊 Analysis Results")
+                        
+                        # Show ImageKit status if available
+                        if 'imagekit' in result and result['imagekit']:
+                            if result['imagekit'].get('success'):
+                                st.success("☁️ Image successfully uploaded to ImageKit!")
+                                st.info(f"**ImageKit URL:** [View Image]({result['imagekit']['imagekit_url']})")
+                                st.info(f"**ImageKit ID:** {result['imagekit']['imagekit_id']}")
+                                
+                                # Display the uploaded image from ImageKit
+                                st.image(result['imagekit']['imagekit_url'], caption="Image stored in ImageKit", use_column_width=True)
+                            else:
+                                st.error(f"❌ ImageKit upload failed: {result['imagekit'].get('error', 'Unknown error')}")
+                        
+                        st.json(result)
+                        
+                        # Download button for JSON (same bytes that were written to disk)
+                        st.download_button(
+                            label="📥 Download JSON",
+                            data=json_content,
+                            file_name=os.path.basename(json_path),
+                            mime="application/json"
+                        )
+                        
                     except Exception as e:
                         st.error(f"❌ Error processing image: {str(e)}")
-                        # Clean up temp file if it exists
-                        if os.path.exists(temp_path):
-                            os.remove(temp_path)
     
     with col2:
         st.header("📋 Processing History")
         
-        # Get processing history
-        history = processor.get_processing_history()
+        # Get processing history (served from cache until the output dir changes)
+        history = _load_history(
+            processor,
+            processor.output_dir,
+            os.stat(processor.output_dir).st_mtime_ns
+        )
         
         if not history:
             st.info("No processed images yet. Upload and process your first image!")
@@ -155,10 +223,12 @@ def main():
                     st.write(f"**Status:** {item['status']}")
                     st.write(f"**File:** {item['filename']}")
                     
-                    # Load and display JSON content
+                    # Only parse the JSON once the user asks for the details
+                    if not st.checkbox("Show details", key=f"details_{item['filename']}"):
+                        continue
+                    
                     try:
-                        with open(item['filepath'], 'r', encoding='utf-8') as f:
-                            data = json.load(f)
+                        data = _load_preview(item['filepath'], os.stat(item['filepath']).st_mtime_ns)
                         
                         if item['status'] == 'success':
                             st.write("**Context:**")
@@ -0,0 +1,199 @@
+import io
+import os
+import logging
+from enum import Enum
+from typing import Any, BinaryIO, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Batch logs are zstd-compressed when zstandard is installed, plain JSON Lines otherwise
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+
+PLAIN_SUFFIX = ".jsonl"
+COMPRESSED_SUFFIX = ".jsonl.zst"
+LOG_SUFFIX = COMPRESSED_SUFFIX if zstd is not None else PLAIN_SUFFIX
+
+class HistoryFormat(Enum):
+    """Shape of a stored JSON results document."""
+    NEW = "batches"    # Batch history document: {"batches": [...], ...}
+    OLD = "images"     # Legacy single batch: {"images": [...], ...}
+    UNKNOWN = None     # Anything else (e.g. a single image result)
+
+def classify_history(data: Any) -> HistoryFormat:
+    """Classify a loaded JSON document once, so callers dispatch on a single value."""
+    if not isinstance(data, dict):
+        return HistoryFormat.UNKNOWN
+    if isinstance(data.get("batches"), list):
+        return HistoryFormat.NEW
+    if isinstance(data.get("images"), list):
+        return HistoryFormat.OLD
+    return HistoryFormat.UNKNOWN
+
+def is_batch_log(filename: str) -> bool:
+    """Check whether a file name is a batch log (plain or compressed)."""
+    return filename.endswith((PLAIN_SUFFIX, COMPRESSED_SUFFIX))
+
+def log_filename(filename: str) -> str:
+    """
+    Normalize a batch history filename to the log name used for writing.
+    
+    "history", "history.json", "history.jsonl" and "history.jsonl.zst" all
+    map to "history" plus LOG_SUFFIX.
+    """
+    for suffix in (COMPRESSED_SUFFIX, PLAIN_SUFFIX, ".json"):
+        if filename.endswith(suffix):
+            filename = filename[:-len(suffix)]
+            break
+    return filename + LOG_SUFFIX
+
+def _require_zstd(filepath: str):
+    if zstd is None:
+        raise RuntimeError(f"zstandard is required to read {os.path.basename(filepath)} (pip install zstandard)")
+
+def open_lines(filepath: str) -> BinaryIO:
+    """
+    Open a batch log for reading line by line.
+    
+    Compressed logs are decompressed as a stream, so memory stays bounded
+    by a line rather than the whole log.
+    
+    Returns:
+        Binary file object yielding one batch line per iteration
+    """
+    if not filepath.endswith(COMPRESSED_SUFFIX):
+        return open(filepath, 'rb')
+    _require_zstd(filepath)
+    reader = zstd.ZstdDecompressor().stream_reader(open(filepath, 'rb'), read_across_frames=True, closefd=True)
+    return io.BufferedReader(reader)
+
+def append(filepath: str, data: bytes):
+    """
+    Append complete lines to a batch log.
+    
+    For compressed logs each append is written as its own zstd frame, so
+    the file never has to be rewritten and readers can resume at any frame
+    boundary.
+    """
+    if filepath.endswith(COMPRESSED_SUFFIX):
+        _require_zstd(filepath)
+        data = zstd.ZstdCompressor(level=3, threads=-1).compress(data)
+    with open(filepath, 'ab') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+def repair(filepath: str, good_size: int) -> bytes:
+    """
+    Cut off a batch left half-written by a crash during append.
+    
+    A torn line or zstd frame at the end would otherwise make every later
+    append unreadable, so anything after the last complete line (or frame)
+    past good_size, the size after the last append known to have finished,
+    is truncated away.
+    
+    Args:
+        filepath: Path to the batch log
+        good_size: File size after the last complete append
+    
+    Returns:
+        Complete lines found after good_size (appended but not yet accounted for)
+    """
+    size = os.path.getsize(filepath)
+    if size <= good_size:
+        return b""
+    
+    try:
+        complete, end = read_tail(filepath, good_size)
+    except Exception:
+        # Corrupt rather than just truncated; drop everything after the known-good point
+        complete, end = b"", good_size
+    if end < size:
+        logger.warning("⚠️ Truncating %s bytes of an interrupted append from %s", size - end, os.path.basename(filepath))
+        os.truncate(filepath, end)
+    return complete
+
+# Longest possible zstd frame header, and the magic number range of skippable frames
+MAX_FRAME_HEADER_SIZE = 18
+SKIPPABLE_MAGIC = 0x184D2A50
+
+def _frame_end(view: memoryview, pos: int) -> Optional[int]:
+    """
+    Find where the zstd frame starting at pos ends, from its header and block headers.
+    
+    Only headers are read, so walking a log's frames is linear in their count
+    rather than copying the rest of the buffer per frame.
+    
+    Returns:
+        Offset just past the frame, or None if the frame isn't complete in view yet
+    """
+    size = len(view)
+    if size - pos >= 4 and int.from_bytes(view[pos:pos + 4], "little") & 0xFFFFFFF0 == SKIPPABLE_MAGIC:
+        if size - pos < 8:
+            return None
+        end = pos + 8 + int.from_bytes(view[pos + 4:pos + 8], "little")
+        return end if end <= size else None
+    
+    header = view[pos:pos + MAX_FRAME_HEADER_SIZE]
+    try:
+        params = zstd.get_frame_parameters(header)
+        end = pos + zstd.frame_header_size(header)
+    except zstd.ZstdError:
+        if len(header) < MAX_FRAME_HEADER_SIZE:
+            return None  # Header still being written
+        raise
+    
+    while True:
+        if end + 3 > size:
+            return None
+        block_header = int.from_bytes(view[end:end + 3], "little")
+        block_type = (block_header >> 1) & 3
+        if block_type == 3:
+            raise zstd.ZstdError("reserved zstd block type")
+        # RLE blocks store a single byte; raw and compressed blocks store block_size bytes
+        end += 3 + (1 if block_type == 1 else block_header >> 3)
+        if block_header & 1:
+            break
+    if params.has_checksum:
+        end += 4
+    return end if end <= size else None
+
+def read_tail(filepath: str, offset: int = 0) -> Tuple[bytes, int]:
+    """
+    Read the complete lines appended to a batch log since offset.
+    
+    Args:
+        filepath: Path to the batch log
+        offset: Byte offset in the file (as returned by a previous call)
+    
+    Returns:
+        Tuple of (decompressed complete lines, offset to resume from next time)
+    """
+    with open(filepath, 'rb') as f:
+        f.seek(offset)
+        chunk = f.read()
+    
+    if not filepath.endswith(COMPRESSED_SUFFIX):
+        # A batch still being written has no trailing newline yet; pick it up next time
+        complete = chunk[:chunk.rfind(b"\n") + 1]
+        return complete, offset + len(complete)
+    
+    _require_zstd(filepath)
+    view = memoryview(chunk)
+    decompressor = zstd.ZstdDecompressor()
+    parts = []
+    pos = 0
+    while pos < len(view):
+        end = _frame_end(view, pos)
+        if end is None:
+            # Frame still being written; resume from its start next time
+            break
+        if int.from_bytes(view[pos:pos + 4], "little") & 0xFFFFFFF0 != SKIPPABLE_MAGIC:
+            frame = decompressor.decompressobj()
+            parts.append(frame.decompress(view[pos:end]))
+            if not frame.eof:
+                raise zstd.ZstdError("zstd frame ended early")
+        pos = end
+    return b"".join(parts), offset + pos
@@ -6,8 +6,12 @@ Command-line interface for Image Context Analyzer
 import argparse
 import os
 import sys
-from dotenv import load_dotenv
-from image_processor import ImageProcessor
+import re
+from pathlib import PurePath
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Supported image extensions (.png, .jpg, .jpeg, .gif, .bmp, .webp), matched in one pass
+_IMG_RE = re.compile(r'\.(png|jpe?g|gif|bmp|webp)$', re.IGNORECASE)
 
 def main():
     parser = argparse.ArgumentParser(
@@ -19,11 +23,15 @@ Examples:
   python cli.py image.jpg --prompt "Describe the colors and mood"
   python cli.py image.jpg --output my_analysis.json
   python cli.py --batch images_folder/
+  python cli.py --batch images_folder/ --concurrency 4
   python cli.py --history
         """
     )
     
-    parser.add_argument(
+    # Only one mode can be chosen per invocation
+    mode = parser.add_mutually_exclusive_group()
+    
+    mode.add_argument(
         "image_path",
         nargs="?",
         help="Path to the image file to process"
@@ -39,12 +47,19 @@ Examples:
         help="Custom output filename for JSON (without .json extension)"
     )
     
-    parser.add_argument(
+    mode.add_argument(
         "--batch", "-b",
         help="Process all images in a directory"
     )
     
     parser.add_argument(
+        "--concurrency", "-c",
+        type=int,
+        default=8,
+        help="Number of images processed in parallel in batch mode (default: 8)"
+    )
+    
+    mode.add_argument(
         "--history", "-H",
         action="store_true",
         help="Show processing history"
@@ -58,8 +73,24 @@ Examples:
     
     args = parser.parse_args()
     
+    if not (args.history or args.batch or args.image_path):
+        parser.print_help()
+        sys.exit(1)
+    
+    # History only reads the local index, so skip the API setup entirely
+    if args.history:
+        from history_index import HistoryIndex
+        show_history(HistoryIndex("processed_images").load())
+        return
+    
+    # Deferred so --help and --history start without loading the SDKs
+    from dotenv import load_dotenv
+    from image_processor import ImageProcessor
+    from log_setup import configure_logging
+    
     # Load environment variables
     load_dotenv()
+    configure_logging()
     
     # Check for API key
     api_key = os.getenv("GEMINI_API_KEY")
@@ -77,34 +108,36 @@ Examples:
         print(f"❌ Error: Failed to initialize Gemini API: {str(e)}")
         sys.exit(1)
     
-    # Handle different modes
-    if args.history:
-        show_history(processor)
-    elif args.batch:
-        process_batch(processor, args.batch, args.prompt, args.verbose)
-    elif args.image_path:
-        process_single(processor, args.image_path, args.prompt, args.output, args.verbose)
-    else:
-        parser.print_help()
-        sys.exit(1)
+    # Handle different modes (the modes exit through sys.exit, which still runs the finally)
+    try:
+        if args.batch:
+            process_batch(processor, args.batch, args.prompt, args.verbose, args.concurrency)
+        else:
+            process_single(processor, args.image_path, args.prompt, args.output, args.verbose)
+    finally:
+        # Let background ImageKit uploads finish before the interpreter exits
+        processor.close()
 
-def show_history(processor):
+def show_history(history):
     """Display processing history."""
     print("📋 Processing History:")
     print("-" * 50)
     
-    history = processor.get_processing_history()
-    
     if not history:
         print("No processed images found.")
         return
     
+    # Build the whole listing first and write it in one go
+    lines = []
     for i, item in enumerate(history, 1):
-        print(f"{i}. 📸 {item['image_name']}")
-        print(f"   📅 {item['timestamp']}")
-        print(f"   📁 {item['filename']}")
-        print(f"   ✅ {item['status']}")
-        print()
+        lines.append(
+            f"{i}. 📸 {item['image_name']}\n"
+            f"   📅 {item['timestamp']}\n"
+            f"   📁 {item['filename']}\n"
+            f"   ✅ {item['status']}\n\n"
+        )
+    sys.stdout.write("".join(lines))
+    sys.stdout.flush()
 
 def process_single(processor, image_path, prompt, output_filename, verbose):
     """Process a single image."""
@@ -118,8 +151,15 @@ def process_single(processor, image_path, prompt, output_filename, verbose):
             print(f"📝 Using custom prompt: {prompt}")
     
     try:
-        # Process image
-        result = processor.process_image(image_path, prompt)
+        # Stream the analysis to stdout as it arrives
+        chunks = []
+        for chunk in processor.process_image_stream(image_path, prompt):
+            chunks.append(chunk)
+            sys.stdout.write(chunk)
+            sys.stdout.flush()
+        print()
+        
+        result = processor.build_result(image_path, "".join(chunks), prompt)
         
         if result["processing_status"] == "success":
             # Save to JSON
@@ -134,7 +174,6 @@ def process_single(processor, image_path, prompt, output_filename, verbose):
                 print(f"   Size: {result['image_size']['width']}x{result['image_size']['height']}")
                 print(f"   Format: {result['image_size']['format']}")
                 print(f"   Context length: {len(result['context'])} characters")
-                print(f"\nContext preview: {result['context'][:200]}...")
         else:
             print(f"❌ Processing failed: {result.get('error', 'Unknown error')}")
             sys.exit(1)
@@ -143,7 +182,7 @@ def process_single(processor, image_path, prompt, output_filename, verbose):
         print(f"❌ Error processing image: {str(e)}")
         sys.exit(1)
 
-def process_batch(processor, directory, prompt, verbose):
+def process_batch(processor, directory, prompt, verbose, concurrency=8):
     """Process all images in a directory."""
     if not os.path.exists(directory):
         print(f"❌ Error: Directory not found: {directory}")
@@ -153,14 +192,9 @@ def process_batch(processor, directory, prompt, verbose):
         print(f"❌ Error: Path is not a directory: {directory}")
         sys.exit(1)
     
-    # Supported image extensions
-    image_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp'}
-    
     # Find image files
-    image_files = []
-    for file in os.listdir(directory):
-        if any(file.lower().endswith(ext) for ext in image_extensions):
-            image_files.append(os.path.join(directory, file))
+    with os.scandir(directory) as it:
+        image_files = [entry.path for entry in it if entry.is_file() and _IMG_RE.search(entry.name)]
     
     if not image_files:
         print(f"❌ No image files found in directory: {directory}")
@@ -174,28 +208,35 @@ def process_batch(processor, directory, prompt, verbose):
     successful = 0
     failed = 0
     
-    for i, image_path in enumerate(image_files, 1):
-        print(f"[{i}/{len(image_files)}] Processing: {os.path.basename(image_path)}")
+    # Gemini calls are network-bound, so threads overlap the round-trips
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {
+            executor.submit(processor.process_image, image_path, prompt): image_path
+            for image_path in image_files
+        }
         
-        try:
-            result = processor.process_image(image_path, prompt)
+        for i, future in enumerate(as_completed(futures), 1):
+            image_path = PurePath(futures[future])
+            print(f"[{i}/{len(image_files)}] Processed: {image_path.name}")
             
-            if result["processing_status"] == "success":
-                # Save to JSON with image name
-                base_name = os.path.splitext(os.path.basename(image_path))[0]
-                json_path = processor.save_to_json(result, f"{base_name}_analysis")
+            try:
+                result = future.result()
                 
-                print(f"   ✅ Success - Saved to: {os.path.basename(json_path)}")
-                successful += 1
-            else:
-                print(f"   ❌ Failed: {result.get('error', 'Unknown error')}")
+                if result["processing_status"] == "success":
+                    # Save to JSON with image name
+                    json_path = processor.save_to_json(result, f"{image_path.stem}_analysis")
+                    
+                    print(f"   ✅ Success - Saved to: {PurePath(json_path).name}")
+                    successful += 1
+                else:
+                    print(f"   ❌ Failed: {result.get('error', 'Unknown error')}")
+                    failed += 1
+                    
+            except Exception as e:
+                print(f"   ❌ Error: {str(e)}")
                 failed += 1
-                
-        except Exception as e:
-            print(f"   ❌ Error: {str(e)}")
-            failed += 1
-        
-        print()
+            
+            print()
     
     # Summary
     print("=" * 50)
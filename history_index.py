@@ -0,0 +1,142 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Tuple
+import json_utils
+import batch_log
+
+logger = logging.getLogger(__name__)
+
+# Running totals for the batch logs; not a result document itself
+HISTORY_META_FILENAME = "history_meta.json"
+
+class HistoryIndex:
+    def __init__(self, output_dir: str, index_filename: str = "history.jsonl"):
+        """
+        Append-only index of the JSON results saved in output_dir.
+        
+        Kept separate from ImageProcessor so the history can be listed without
+        importing the Gemini SDK or configuring an API key.
+        """
+        self.output_dir = output_dir
+        self.filename = index_filename
+        self.path = os.path.join(output_dir, index_filename)
+    
+    def load(self) -> list:
+        """
+        Get list of all processed JSON files, newest first.
+        
+        Returns:
+            List of dictionaries with filename, filepath, timestamp, image_name and status
+        """
+        if not os.path.isdir(self.output_dir):
+            return []
+        
+        if self._is_stale():
+            self.rebuild()
+        
+        # Later lines win, so re-saving a file just updates its entry
+        entries = {}
+        try:
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json_utils.loads(line)
+                        entries[entry["filepath"]] = entry
+        except Exception as e:
+            logger.warning("⚠️ Error reading history index: %s", e)
+            return self.scan()
+        
+        # Drop entries for files removed since they were indexed
+        json_files = [entry for entry in entries.values() if os.path.exists(entry["filepath"])]
+        
+        # Sort by timestamp (newest first)
+        json_files.sort(key=lambda x: x["timestamp"], reverse=True)
+        return json_files
+    
+    def append(self, filename: str, filepath: str, data: Any):
+        """
+        Record a saved JSON document in the index.
+        
+        Args:
+            filename: Name of the saved file
+            filepath: Path to the saved file
+            data: The document that was saved
+        """
+        # Without an index yet, a full scan picks up this file along with everything already on disk
+        if not os.path.exists(self.path):
+            self.rebuild()
+            return
+        
+        try:
+            with open(self.path, 'ab') as f:
+                f.write(json_utils.dumps(self.entry(filename, filepath, data)) + b"\n")
+        except Exception as e:
+            logger.warning("⚠️ Failed to update history index: %s", e)
+    
+    def rebuild(self):
+        """Rebuild the index from a full scan of the output directory."""
+        json_files = self.scan()
+        try:
+            payload = b"".join(json_utils.dumps(item) + b"\n" for item in json_files)
+            json_utils.write_atomic(self.path, payload)
+        except Exception as e:
+            logger.warning("⚠️ Failed to rebuild history index: %s", e)
+    
+    def scan(self) -> list:
+        """Build the history list by parsing every JSON file in the output directory."""
+        documents, json_files = [], []
+        with os.scandir(self.output_dir) as it:
+            for dir_entry in it:
+                file, filepath = dir_entry.name, dir_entry.path
+                if not (file.endswith('.json') or batch_log.is_batch_log(file)) or not dir_entry.is_file() or dir_entry.stat().st_size == 0:
+                    continue
+                if file.endswith('.json') and file != HISTORY_META_FILENAME:
+                    documents.append((file, filepath))
+                elif batch_log.is_batch_log(file) and filepath != self.path:
+                    # Batch logs are listed as a whole, without reading every batch
+                    json_files.append(self.entry(file, filepath, {}))
+        
+        # Reading is I/O bound, so parse the documents on a few threads
+        if documents:
+            with ThreadPoolExecutor(max_workers=min(8, len(documents))) as executor:
+                json_files.extend(entry for entry in executor.map(self._load_entry, documents) if entry)
+        
+        # Sort by timestamp (newest first)
+        json_files.sort(key=lambda x: x["timestamp"], reverse=True)
+        return json_files
+    
+    def _load_entry(self, document: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        """Parse one (filename, filepath) document into its index entry, or None if unreadable."""
+        file, filepath = document
+        try:
+            data = json_utils.load_file(filepath)
+        except Exception:
+            return None
+        return self.entry(file, filepath, data)
+    
+    @staticmethod
+    def entry(filename: str, filepath: str, data: Any) -> Dict[str, Any]:
+        """Build the index entry for a saved JSON document."""
+        if not isinstance(data, dict):
+            data = {}
+        return {
+            "filename": filename,
+            "filepath": filepath,
+            "timestamp": data.get("timestamp", "Unknown"),
+            "image_name": data.get("image_name", "Unknown"),
+            "status": data.get("processing_status", "Unknown")
+        }
+    
+    def _is_stale(self) -> bool:
+        """
+        Check whether the index needs rebuilding.
+        
+        Saves touch the index after creating their file, so the index is
+        only older than the directory when files were added or removed
+        behind our back.
+        """
+        try:
+            return os.stat(self.path).st_mtime_ns < os.stat(self.output_dir).st_mtime_ns
+        except FileNotFoundError:
+            return True
@@ -1,124 +1,33 @@
 import os
-import json
+import logging
+import hashlib
+import heapq
+import shutil
 import base64
+import asyncio
+import threading
+import time
+import random
+import re
+import multiprocessing
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any, Optional
-import google.generativeai as genai
+from functools import lru_cache
+from itertools import chain, count, islice
+from typing import Dict, Any, Iterator, Optional, Tuple
+import json_utils
+import batch_log
 from PIL import Image
 import io
-from imagekit_service import ImageKitService
+from pathlib import Path
+from history_index import HistoryIndex, HISTORY_META_FILENAME
+from search_index import SearchIndex
+from result_cache import ResultCache
 
-class ImageProcessor:
-    def __init__(self, api_key: str):
-        """Initialize the ImageProcessor with Gemini API key."""
-        self.api_key = api_key
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-pro')
-        self.output_dir = "processed_images"
-        self.uploads_dir = "uploads"
-        
-        # Initialize ImageKit service
-        try:
-            self.imagekit_service = ImageKitService()
-            print("✅ ImageKit service initialized successfully")
-        except Exception as e:
-            print(f"⚠️ ImageKit service initialization failed: {str(e)}")
-            self.imagekit_service = None
-        
-        self.ensure_directories()
-    
-    def ensure_directories(self):
-        """Create output and uploads directories if they don't exist."""
-        for directory in [self.output_dir, self.uploads_dir]:
-            if not os.path.exists(directory):
-                os.makedirs(directory)
-        
-        # Clean up old files and migrate to new structure
-        self._migrate_old_files()
-        
-        # Clean up any temporary files in main directory
-        self._cleanup_temp_files()
-    
-    def _migrate_old_files(self):
-        """Migrate old JSON files to the new batch structure."""
-        try:
-            # Look for old format files (files with 'images' array but no 'batches' array)
-            for filename in os.listdir(self.output_dir):
-                if filename.endswith('.json'):
-                    filepath = os.path.join(self.output_dir, filename)
-                    try:
-                        with open(filepath, 'r', encoding='utf-8') as f:
-                            data = json.load(f)
-                        
-                        # Check if this is old format that needs migration
-                        if isinstance(data, dict) and "images" in data and isinstance(data["images"], list) and "batches" not in data:
-                            print(f"🔄 Found old format file: {filename}")
-                            
-                            # Create new structure
-                            new_data = {
-                                "batches": [data],  # Wrap old data as first batch
-                                "total_images_processed": data.get("total_images", 0),
-                                "last_updated": data.get("batch_timestamp", datetime.now().isoformat())
-                            }
-                            
-                            # Save as new format
-                            new_filename = "image_analysis_history.json"
-                            new_filepath = os.path.join(self.output_dir, new_filename)
-                            
-                            with open(new_filepath, 'w', encoding='utf-8') as f:
-                                json.dump(new_data, f, indent=2, ensure_ascii=False)
-                            
-                            print(f"✅ Migrated {filename} to {new_filename}")
-                            
-                            # Remove old file
-                            os.remove(filepath)
-                            print(f"🧹 Removed old file: {filename}")
-                            
-                    except Exception as e:
-                        print(f"⚠️ Error processing {filename}: {e}")
-                        continue
-                        
-        except Exception as e:
-            print(f"⚠️ Error during migration: {e}")
-    
-    def _cleanup_temp_files(self):
-        """Clean up any temporary files in the main directory."""
-        try:
-            current_dir = os.getcwd()
-            for filename in os.listdir(current_dir):
-                if filename.startswith('temp_') and (filename.endswith('.png') or filename.endswith('.jpg') or filename.endswith('.jpeg')):
-                    filepath = os.path.join(current_dir, filename)
-                    try:
-                        os.remove(filepath)
-                        print(f"🧹 Cleaned up old temp file: {filename}")
-                    except Exception as e:
-                        print(f"⚠️ Could not remove old temp file {filename}: {e}")
-        except Exception as e:
-            print(f"⚠️ Error during temp file cleanup: {e}")
-    
-    def process_image(self, image_path: str, prompt: str = None) -> Dict[str, Any]:
-        """
-        Process an image with Gemini 2.5 Pro and return the context.
-        
-        Args:
-            image_path: Path to the image file
-            prompt: Optional custom prompt for image analysis
-            
-        Returns:
-            Dictionary containing image context and metadata
-        """
-        try:
-            # Load and prepare the image
-            image = Image.open(image_path)
-            
-            # Convert image to bytes for Gemini - use PNG format for better compatibility
-            img_byte_arr = io.BytesIO()
-            image.save(img_byte_arr, format='PNG')
-            img_byte_arr.seek(0)  # Reset position to beginning
-            
-            # Default prompt if none provided
-            if prompt is None:
-                prompt = """
+logger = logging.getLogger(__name__)
+
+# Default prompt used when no custom prompt is provided
+DEFAULT_PROMPT = """
                 
                 # Universal Enhanced Image Analysis Prompt
 
@@ -384,93 +293,930 @@ Rate event identification confidence:
 ---
 
 *Remember: This analysis should be thorough but respectful of privacy, accurate but acknowledging uncertainty, and comprehensive while remaining accessible to human readers.*"""
+
+# Follows the analysis prompt when several images are sent in one Gemini request.
+# Every request starts with the unchanged prompt text, so Gemini's implicit context
+# cache can reuse that shared prefix instead of processing it again per request.
+MULTI_IMAGE_PROMPT = """
+You will receive {count} images, each preceded by a label of the form "===IMAGE n===".
+Analyse every image separately, following the instructions above for each one.
+Start the analysis of each image with its label alone on a line, exactly as given
+(e.g. "===IMAGE 1==="), answer for the images in order, and do not compare them."""
+
+# Label line that separates the per-image analyses in a multi-image response
+IMAGE_LABEL_PATTERN = re.compile(r"^[ \t*#]*===\s*IMAGE\s+(\d+)\s*===[ \t*]*$", re.MULTILINE)
+
+# Most images sent together in one Gemini request, whatever images_per_request asks for
+MAX_IMAGES_PER_REQUEST = 8
+
+# Number of stored images summarized in the AI search prompt
+AI_SEARCH_PROMPT_IMAGES = 50
+
+# Distinct (query, max_results) keyword searches whose matches are kept in memory
+SEARCH_CACHE_SIZE = 256
+
+# Longest edge sent to Gemini when downscaling large images
+MAX_IMAGE_EDGE = 1568
+
+# Encoded formats Gemini accepts as-is, so a file in one of them is sent without re-encoding
+GEMINI_IMAGE_FORMATS = ('JPEG', 'PNG', 'WEBP')
+
+# Default JSON Lines log that batch results are appended to, one batch per line
+BATCH_HISTORY_FILENAME = "image_analysis_history" + batch_log.LOG_SUFFIX
+
+# Written once old files have been migrated, so later startups can skip the scan
+MIGRATION_MARKER_FILENAME = ".migrated_v2"
+
+# Leftover temp uploads in the working directory that are removed at startup
+TEMP_FILE_SUFFIXES = frozenset({'.png', '.jpg', '.jpeg'})
+
+# Taken (and never released) by the first processor to start the temp-file sweep in this process
+_temp_cleanup_once = threading.Lock()
+
+def _relevance_score(word_count: int, matching_words: int, phrase_match: bool, name_match: bool) -> float:
+    """
+    Combine the keyword matches of one image into a relevance score (0.0 to 1.0).
+    
+    Args:
+        word_count: Number of query words
+        matching_words: Query words found in the image context (repeats counted)
+        phrase_match: Whether the whole query appears as a phrase in the context
+        name_match: Whether a query word is part of the image name
+    """
+    word_relevance = matching_words / word_count
+    
+    # The phrase only counts when it has several words and they all matched
+    phrase_relevance = 0.0
+    if word_count > 1 and matching_words == word_count and phrase_match:
+        phrase_relevance = 1.0
+    
+    name_relevance = 0.5 if name_match else 0.0
+    
+    # Weighted combination
+    final_score = (word_relevance * 0.6) + (phrase_relevance * 0.3) + (name_relevance * 0.1)
+    
+    return min(final_score, 1.0)
+
+def _context_preview(context: str, length: int = 200) -> str:
+    """Shorten a context for the AI search prompt."""
+    return context[:length] + '...' if len(context) > length else context
+
+def _encode_image(image: Image.Image, fmt: str, **params) -> bytes:
+    """Encode an image to bytes in the given format."""
+    # getvalue() on an unshared BytesIO hands over its buffer instead of copying it,
+    # and the with block drops the buffer as soon as the bytes are out
+    with io.BytesIO() as buf:
+        image.save(buf, format=fmt, **params)
+        return buf.getvalue()
+
+def _shrink_image(image: Image.Image, max_edge: int):
+    """Downscale an image in place so its longest edge is at most max_edge."""
+    # Let libjpeg decode straight to a reduced scale instead of full resolution
+    image.draft('RGB', (max_edge, max_edge))
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+def _encode_upload_part(image: Image.Image) -> Dict[str, Any]:
+    """Encode a downscaled image as a JPEG blob, or a PNG one if it has transparency."""
+    if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+        return {"mime_type": "image/png", "data": _encode_image(image, 'PNG')}
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    return {"mime_type": "image/jpeg", "data": _encode_image(image, 'JPEG', quality=85)}
+
+def _downscale_image_part(raw: bytes, max_edge: int) -> Tuple[Dict[str, Any], Tuple[int, int]]:
+    """
+    Decode, downscale and encode an image file's bytes for a Gemini request.
+    
+    Kept at module level, free of processor state, so it can run in a worker process.
+    
+    Returns:
+        Tuple of (image part, downscaled size)
+    """
+    with Image.open(io.BytesIO(raw)) as image:
+        _shrink_image(image, max_edge)
+        return _encode_upload_part(image), image.size
+
+class AsyncRateLimiter:
+    def __init__(self, requests_per_second: float):
+        """Space out async calls so at most requests_per_second are started."""
+        self.min_interval = 1.0 / requests_per_second
+        self._last_call = 0.0
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self):
+        """Wait until the next call is allowed to start."""
+        async with self._lock:
+            wait = self.min_interval - (time.monotonic() - self._last_call)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._last_call = time.monotonic()
+
+class ImageProcessor:
+    def __init__(self, api_key: str, max_image_edge: int = MAX_IMAGE_EDGE):
+        """
+        Initialize the ImageProcessor with Gemini API key.
+        
+        Args:
+            api_key: Gemini API key
+            max_image_edge: Longest edge, in pixels, of the images sent to Gemini; larger ones are downscaled
+        """
+        self.api_key = api_key
+        self.max_image_edge = max_image_edge
+        
+        # Imported here so history-only callers don't pay for loading the SDK
+        import google.generativeai as genai
+        # The SDK's default gRPC transports (grpc / grpc_asyncio) each keep one multiplexed HTTP/2
+        # channel that every call through self.model reuses; transport="rest" would lose that
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel('gemini-2.5-pro')
+        self.output_dir = "processed_images"
+        self.uploads_dir = "uploads"
+        self.prompts_dir = os.path.join(self.output_dir, "prompts")
+        
+        # Prompt text -> ID for prompts already written to prompts_dir, so the
+        # (multi-KB) default prompt isn't re-encoded and re-hashed for every image
+        self._prompt_ids: Dict[str, str] = {}
+        self.history_index = HistoryIndex(self.output_dir)
+        self.search_index = SearchIndex(self.output_dir)
+        # Keyword matches per (query words, max_results, index generation); entries for an
+        # older generation are never hit again and simply age out
+        self._cached_keyword_matches = lru_cache(maxsize=SEARCH_CACHE_SIZE)(self._score_keyword_matches)
+        self.result_cache = ResultCache(os.path.join(self.output_dir, ".cache"))
+        
+        # Serializes batch log appends and their history_meta.json update
+        self._batch_log_lock = threading.Lock()
+        
+        # Background event loop for the async batch path, started on first use
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        
+        # ImageKit uploads run here while the Gemini request is in flight
+        self._io_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="upload-io")
+        
+        # Upload names are <name>_<session tag>_<counter>; the tag is formatted once, and
+        # next() on the shared counter is atomic, so concurrent copies never collide
+        self._session_tag = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+        self._upload_counter = count()
+        
+        # Initialize ImageKit service
+        try:
+            from imagekit_service import ImageKitService
+            # Shares the cache directory, so an image already uploaded is never sent again
+            self.imagekit_service = ImageKitService(cache_dir=self.result_cache.cache_dir)
+            logger.info("✅ ImageKit service initialized successfully")
+        except Exception as e:
+            logger.warning("⚠️ ImageKit service initialization failed: %s", e)
+            self.imagekit_service = None
+        
+        self.ensure_directories()
+    
+    def close(self):
+        """Wait for background ImageKit uploads to finish, then release their threads and connections."""
+        self._io_pool.shutdown(wait=True)
+        if self.imagekit_service is not None:
+            self.imagekit_service.close()
+    
+    def ensure_directories(self):
+        """Create output and uploads directories if they don't exist."""
+        for directory in [self.output_dir, self.uploads_dir]:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+        
+        # Clean up old files and migrate to new structure. This only needs to happen once per
+        # output dir, and again if the batch log format changes (zstandard installed or removed)
+        marker = Path(self.output_dir, MIGRATION_MARKER_FILENAME)
+        try:
+            migrated = marker.read_text() == batch_log.LOG_SUFFIX
+        except OSError:
+            migrated = False
+        if not migrated and self._migrate_old_files():
+            marker.write_text(batch_log.LOG_SUFFIX)
+        
+        # Clean up any temporary files in main directory without delaying startup. Leftovers can
+        # only come from an earlier run, so one sweep per process is enough
+        if _temp_cleanup_once.acquire(blocking=False):
+            threading.Thread(target=self._cleanup_temp_files, name="temp-cleanup", daemon=True).start()
+    
+    def _migrate_old_files(self) -> bool:
+        """
+        Migrate old JSON batch files into the JSON Lines batch logs.
+        
+        Returns:
+            True if every file was migrated (or nothing needed migrating)
+        """
+        complete = True
+        try:
+            # Collect candidates up front, since migrating adds and removes files in this directory.
+            # Batch logs stored in the other format (plain vs. zstd) are converted too.
+            index_filename = self.history_index.filename
+            with os.scandir(self.output_dir) as it:
+                entries = [
+                    entry for entry in it
+                    if ((entry.name.endswith('.json') and entry.name != HISTORY_META_FILENAME)
+                        or (batch_log.is_batch_log(entry.name) and entry.name != index_filename
+                            and not entry.name.endswith(batch_log.LOG_SUFFIX)))
+                    and entry.is_file(follow_symlinks=False) and entry.stat().st_size > 0
+                ]
             
-            # Generate content with Gemini - pass the PIL Image object directly
-            print(f"🤖 Sending image to Gemini API...")
-            print(f"   Image format: {image.format}")
-            print(f"   Image size: {image.size}")
-            print(f"   Image mode: {image.mode}")
+            for entry in entries:
+                filename, filepath = entry.name, entry.path
+                try:
+                    if batch_log.is_batch_log(filename):
+                        if batch_log.zstd is None:
+                            logger.warning("⚠️ %s is zstd-compressed; install zstandard to read it", filename)
+                            complete = False
+                            continue
+                        
+                        logger.info("🔄 Found uncompressed batch log: %s", filename)
+                        new_filename = self._batch_log_filename(filename)
+                        self._append_batches(new_filename, list(self._iter_batch_log(filepath)), keep_ids=True)
+                        
+                        # Its totals now live under the compressed log's name
+                        with self._batch_log_lock:
+                            meta = self._load_history_meta()
+                            if meta.pop(filename, None) is not None:
+                                self._write_history_meta(meta)
+                        
+                        logger.info("✅ Compressed %s to %s", filename, new_filename)
+                        os.remove(filepath)
+                        logger.info("🧹 Removed old file: %s", filename)
+                        continue
+                    
+                    data = json_utils.load_file(filepath)
+                    
+                    history_format = batch_log.classify_history(data)
+                    
+                    # Batch history documents become a .jsonl log of the same name
+                    if history_format is batch_log.HistoryFormat.NEW:
+                        logger.info("🔄 Found old batch history file: %s", filename)
+                        new_filename = self._batch_log_filename(filename)
+                        self._append_batches(new_filename, data["batches"], keep_ids=True)
+                    
+                    # Old format files (files with 'images' array but no 'batches' array) join the default log
+                    elif history_format is batch_log.HistoryFormat.OLD:
+                        logger.info("🔄 Found old format file: %s", filename)
+                        new_filename = BATCH_HISTORY_FILENAME
+                        self._append_batches(new_filename, [data])
+                    
+                    else:
+                        continue
+                    
+                    logger.info("✅ Migrated %s to %s", filename, new_filename)
+                    
+                    # Remove old file
+                    os.remove(filepath)
+                    logger.info("🧹 Removed old file: %s", filename)
+                    
+                except Exception as e:
+                    logger.warning("⚠️ Error processing %s: %s", filename, e)
+                    complete = False
+                    continue
+                    
+        except Exception as e:
+            logger.warning("⚠️ Error during migration: %s", e)
+            return False
+        
+        return complete
+    
+    def _cleanup_temp_files(self):
+        """Clean up any temporary files in the main directory."""
+        try:
+            # One readdir pass; DirEntry carries the name and file type without extra stat calls
+            with os.scandir(os.getcwd()) as it:
+                for entry in it:
+                    if not (entry.name.startswith('temp_')
+                            and os.path.splitext(entry.name)[1].lower() in TEMP_FILE_SUFFIXES
+                            and entry.is_file(follow_symlinks=False)):
+                        continue
+                    try:
+                        os.remove(entry.path)
+                        logger.info("🧹 Cleaned up old temp file: %s", entry.name)
+                    except Exception as e:
+                        logger.warning("⚠️ Could not remove old temp file %s: %s", entry.name, e)
+        except Exception as e:
+            logger.warning("⚠️ Error during temp file cleanup: %s", e)
+    
+    def process_image(self, image_path: str, prompt: str = None, image_bytes: bytes = None, mime_type: str = None,
+                      no_cache: bool = False) -> Dict[str, Any]:
+        """
+        Process an image with Gemini 2.5 Pro and return the context.
+        
+        Args:
+            image_path: Path to the image file (used as the image name when image_bytes is given)
+            prompt: Optional custom prompt for image analysis
+            image_bytes: Optional in-memory image data to process instead of reading image_path
+            mime_type: MIME type of image_bytes (e.g. "image/jpeg")
+            no_cache: Skip the result cache, neither reading nor storing a cached result
             
-            try:
-                response = self.model.generate_content([prompt, image])
-                print(f"✅ Gemini API response received ({len(response.text)} characters)")
-            except Exception as gemini_error:
-                print(f"❌ Gemini API error: {str(gemini_error)}")
-                # Try alternative approach with bytes
-                print(f"🔄 Trying alternative approach with image bytes...")
-                img_bytes = img_byte_arr.getvalue()
-                response = self.model.generate_content([prompt, img_bytes])
-                print(f"✅ Gemini API response received with bytes ({len(response.text)} characters)")
+        Returns:
+            Dictionary containing image context and metadata
+        """
+        raw, image_size, upload = image_bytes, None, None
+        try:
+            # Read the file once; the cache key, decoding and fallback all reuse these bytes
+            raw = self._read_image_bytes(image_path, image_bytes)
+            cache_key, cached = self._lookup_cache(image_path, prompt, raw, no_cache=no_cache)
+            if cached:
+                return cached
             
-            # Extract the response text
-            context = response.text
+            image, prompt = self._prepare_image_request(image_path, prompt, raw)
+            upload = self._start_imagekit_upload(image_path, image_bytes)
             
-            # Upload to ImageKit if service is available
-            imagekit_result = None
-            if self.imagekit_service:
+            # Close the decoded image (and its pixel buffer) as soon as the request is done
+            with image:
+                image_size = self._image_size(image)
+                
                 try:
-                    imagekit_result = self.imagekit_service.upload_image(image_path)
-                    print(f"📤 ImageKit upload result: {imagekit_result.get('success', False)}")
-                except Exception as upload_error:
-                    print(f"⚠️ ImageKit upload failed: {str(upload_error)}")
-                    imagekit_result = {"success": False, "error": str(upload_error)}
+                    response = self._call_gemini_with_retry([prompt, self._image_part(image, image_bytes, mime_type, raw)])
+                    logger.debug("✅ Gemini API response received (%s characters)", len(response.text))
+                except Exception as gemini_error:
+                    logger.error("❌ Gemini API error: %s", gemini_error)
+                    response = self._call_gemini_with_retry([prompt, self._fallback_request_part(image, image_bytes, raw)])
+                    logger.debug("✅ Gemini API response received with bytes (%s characters)", len(response.text))
+                
+                # Extract the response text
+                context = response.text
+                
+                result = self._build_success_result(image_path, image_size, prompt, context, image_bytes, upload=upload)
             
-            # Create result dictionary
-            result = {
-                "timestamp": datetime.now().isoformat(),
-                "image_path": image_path,
-                "image_name": os.path.basename(image_path),
-                "image_size": {
-                    "width": image.width,
-                    "height": image.height,
-                    "format": image.format or "Unknown"
-                },
-                "prompt_used": prompt,
-                "context": context,
-                "processing_status": "success",
-                "imagekit": imagekit_result
-            }
+            if cache_key:
+                self.result_cache.put(cache_key, result)
+            
+            return result
+            
+        except Exception as e:
+            self._discard_imagekit_upload(upload)
+            return self._failure_result(image_path, e, raw, image_size)
+    
+    async def process_image_async(self, image_path: str, prompt: str = None, image_bytes: bytes = None,
+                                  mime_type: str = None, limiter: "AsyncRateLimiter" = None,
+                                  timestamp: str = None, executor: Executor = None,
+                                  no_cache: bool = False) -> Dict[str, Any]:
+        """
+        Async version of process_image using Gemini's async client.
+        
+        Args:
+            image_path: Path to the image file (used as the image name when image_bytes is given)
+            prompt: Optional custom prompt for image analysis
+            image_bytes: Optional in-memory image data to process instead of reading image_path
+            mime_type: MIME type of image_bytes (e.g. "image/jpeg")
+            limiter: Optional rate limiter awaited before each Gemini call
+            timestamp: Optional precomputed ISO timestamp to record (batches share one)
+            executor: Optional executor (e.g. a process pool) that downscales large images
+            no_cache: Skip the result cache, neither reading nor storing a cached result
+            
+        Returns:
+            Dictionary containing image context and metadata
+        """
+        raw, image_size, upload = image_bytes, None, None
+        try:
+            # Read the file once; the cache key, decoding and fallback all reuse these bytes
+            raw = self._read_image_bytes(image_path, image_bytes)
+            cache_key, cached = self._lookup_cache(image_path, prompt, raw, timestamp, no_cache)
+            if cached:
+                return cached
+            
+            image, prompt = self._prepare_image_request(image_path, prompt, raw)
+            upload = self._start_imagekit_upload(image_path, image_bytes)
+            
+            # Close the decoded image (and its pixel buffer) as soon as the request is done
+            with image:
+                image_size = self._image_size(image)
+                
+                try:
+                    part = await self._image_part_async(image, image_bytes, mime_type, raw, executor)
+                    response = await self._call_gemini_with_retry_async([prompt, part], limiter)
+                    logger.debug("✅ Gemini API response received (%s characters)", len(response.text))
+                except Exception as gemini_error:
+                    logger.error("❌ Gemini API error: %s", gemini_error)
+                    response = await self._call_gemini_with_retry_async([prompt, self._fallback_request_part(image, image_bytes, raw)], limiter)
+                    logger.debug("✅ Gemini API response received with bytes (%s characters)", len(response.text))
+                
+                context = response.text
+                
+                # Wait for the ImageKit upload without blocking the event loop
+                if upload is not None:
+                    await asyncio.wrap_future(upload)
+                result = self._build_success_result(image_path, image_size, prompt, context, image_bytes, timestamp, upload)
+            
+            if cache_key:
+                self.result_cache.put(cache_key, result)
             
             return result
             
         except Exception as e:
-            # Try to get basic image info even if processing fails
-            try:
-                temp_image = Image.open(image_path)
-                image_size = {
-                    "width": temp_image.width,
-                    "height": temp_image.height,
-                    "format": temp_image.format or "Unknown"
-                }
-                temp_image.close()
-            except:
-                image_size = {
-                    "width": 0,
-                    "height": 0,
-                    "format": "Unknown"
-                }
+            self._discard_imagekit_upload(upload)
+            return self._failure_result(image_path, e, raw, image_size, timestamp)
+    
+    def _call_gemini_with_retry(self, contents: list, max_attempts: int = 3, base: float = 1.0, cap: float = 30.0,
+                                stream: bool = False):
+        """
+        Call Gemini, retrying rate-limit and transient errors with exponential backoff.
+        
+        Args:
+            contents: Request contents for generate_content
+            max_attempts: Total number of attempts before giving up
+            base: Initial backoff in seconds, doubled after each failed attempt
+            cap: Maximum backoff in seconds
+            stream: Stream the response; only errors raised before its first chunk are retried
+            
+        Returns:
+            The Gemini response, or an iterator over its chunks when streaming
+        """
+        for attempt in range(max_attempts):
+            try:
+                if stream:
+                    return self._start_stream(contents)
+                return self.model.generate_content(contents)
+            except Exception as e:
+                if attempt == max_attempts - 1 or not self._is_retryable_error(e):
+                    raise
+                delay = self._retry_delay(attempt, base, cap)
+                logger.warning("⏳ Gemini call failed (%s), retrying in %.1fs...", str(e)[:80], delay)
+                time.sleep(delay)
+    
+    def _start_stream(self, contents: list) -> Iterator[Any]:
+        """Start a streamed Gemini response, waiting for its first chunk so errors before it surface here."""
+        chunks = iter(self.model.generate_content(contents, stream=True))
+        first = next(chunks, None)
+        return iter(()) if first is None else chain([first], chunks)
+    
+    async def _call_gemini_with_retry_async(self, contents: list, limiter: "AsyncRateLimiter" = None,
+                                            max_attempts: int = 3, base: float = 1.0, cap: float = 30.0):
+        """Async version of _call_gemini_with_retry; each attempt waits on the limiter if given."""
+        for attempt in range(max_attempts):
+            try:
+                if limiter:
+                    await limiter.acquire()
+                return await self.model.generate_content_async(contents)
+            except Exception as e:
+                if attempt == max_attempts - 1 or not self._is_retryable_error(e):
+                    raise
+                delay = self._retry_delay(attempt, base, cap)
+                logger.warning("⏳ Gemini call failed (%s), retrying in %.1fs...", str(e)[:80], delay)
+                await asyncio.sleep(delay)
+    
+    @staticmethod
+    def _is_retryable_error(error: Exception) -> bool:
+        """Return True for rate-limit and transient server errors worth retrying."""
+        try:
+            from google.api_core import exceptions as api_exceptions
+            if isinstance(error, (api_exceptions.ResourceExhausted,
+                                  api_exceptions.ServiceUnavailable,
+                                  api_exceptions.DeadlineExceeded,
+                                  api_exceptions.InternalServerError)):
+                return True
+        except ImportError:
+            pass
+        
+        message = str(error).lower()
+        return any(marker in message for marker in ("429", "quota", "rate limit", "unavailable", "503", "timeout"))
+    
+    @staticmethod
+    def _retry_delay(attempt: int, base: float, cap: float) -> float:
+        """Exponential backoff with a little jitter."""
+        return min(cap, base * 2 ** attempt) + random.uniform(0, 0.5)
+    
+    def _lookup_cache(self, image_path: str, prompt: str = None, image_bytes: bytes = None,
+                      timestamp: str = None, no_cache: bool = False) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Check the result cache for an image and prompt.
+        
+        Returns:
+            Tuple of (cache key, cached result or None); the key is None if the image can't be
+            read or no_cache is set, so nothing gets stored either
+        """
+        if no_cache:
+            return None, None
+        
+        if prompt is None:
+            prompt = DEFAULT_PROMPT
+        
+        try:
+            data = self._read_image_bytes(image_path, image_bytes)
+        except OSError:
+            # Let the normal processing path report the unreadable image
+            return None, None
+        
+        cache_key = self.result_cache.key(data, prompt)
+        return cache_key, self.result_cache.get(cache_key, image_path, timestamp)
+    
+    def _prepare_image_request(self, image_path: str, prompt: str = None, image_bytes: bytes = None):
+        """
+        Open the image and resolve the prompt for a Gemini request.
+        
+        Returns:
+            Tuple of (PIL image, prompt)
+        """
+        # Load and prepare the image
+        image = self._open_image(image_path, image_bytes)
+        
+        # Default prompt if none provided
+        if prompt is None:
+            prompt = DEFAULT_PROMPT
+        
+        # Generate content with Gemini - pass the PIL Image object directly
+        logger.debug("🤖 Sending image to Gemini API...")
+        logger.debug("   Image format: %s", image.format)
+        logger.debug("   Image size: %s", image.size)
+        logger.debug("   Image mode: %s", image.mode)
+        
+        return image, prompt
+    
+    def _fallback_request_part(self, image: Image.Image, image_bytes: bytes = None, raw: bytes = None) -> Any:
+        """Build the retry image part (the first attempt already sent the file's own bytes where it could)."""
+        return self._fallback_image_part(self._prepare_for_upload(image, raw), image_bytes)
+    
+    def _fallback_image_part(self, image: Image.Image, image_bytes: bytes = None) -> Any:
+        """Build the image part used to retry a request Gemini rejected."""
+        if image_bytes is None:
+            # Try alternative approach with freshly encoded bytes, encoded only now that they're needed.
+            # Keep the original format where Gemini accepts it rather than inflating JPEGs into PNGs.
+            logger.info("🔄 Trying alternative approach with image bytes...")
+            fmt = image.format if image.format in GEMINI_IMAGE_FORMATS else 'JPEG'
+            if fmt == 'JPEG' and image.mode != 'RGB':
+                image = image.convert('RGB')
+            return {"mime_type": Image.MIME[fmt], "data": _encode_image(image, fmt, quality=85)}
+        
+        # Raw bytes were rejected, let the SDK encode the decoded image instead
+        logger.info("🔄 Trying alternative approach with the decoded image...")
+        return image
+    
+    def _failure_result(self, image_path: str, error: Exception, image_bytes: bytes = None, image_size: Dict[str, Any] = None,
+                        timestamp: str = None) -> Dict[str, Any]:
+        """Build the result dictionary for an image that could not be processed."""
+        # Try to get basic image info even if processing fails (unless the caller already has it)
+        if image_size is None:
+            try:
+                image_size = self._image_meta(image_path, image_bytes)
+            except:
+                image_size = {
+                    "width": 0,
+                    "height": 0,
+                    "format": "Unknown"
+                }
+        
+        return {
+            "timestamp": timestamp or datetime.now().isoformat(),
+            "image_path": image_path,
+            "image_name": os.path.basename(image_path),
+            "image_size": image_size,
+            "error": str(error),
+            "processing_status": "failed",
+            "context": f"Processing failed: {str(error)}"
+        }
+    
+    def process_image_bytes(self, image_bytes: bytes, mime_type: str, prompt: str = None, image_name: str = "uploaded_image") -> Dict[str, Any]:
+        """
+        Process in-memory image data with Gemini without writing a temp file.
+        
+        Args:
+            image_bytes: Raw image file contents
+            mime_type: MIME type of the image (e.g. "image/jpeg")
+            prompt: Optional custom prompt for image analysis
+            image_name: Name recorded for the image in the result
+            
+        Returns:
+            Dictionary containing image context and metadata
+        """
+        return self.process_image(image_name, prompt, image_bytes=image_bytes, mime_type=mime_type)
+    
+    def downscale_image_bytes(self, image_bytes: bytes, mime_type: str = None, max_edge: int = None) -> Tuple[bytes, str]:
+        """
+        Shrink an encoded image so its longest edge is at most max_edge.
+        
+        Args:
+            image_bytes: Raw image file contents
+            mime_type: MIME type of image_bytes
+            max_edge: Maximum width or height in pixels (defaults to the processor's max_image_edge)
+            
+        Returns:
+            Tuple of (image bytes, MIME type); the input is returned untouched if already small enough
+        """
+        if max_edge is None:
+            max_edge = self.max_image_edge
+        
+        try:
+            with Image.open(io.BytesIO(image_bytes)) as image:
+                if max(image.size) <= max_edge:
+                    return image_bytes, mime_type
+                
+                original_size = image.size
+                _shrink_image(image, max_edge)
+                part = _encode_upload_part(image)
+                logger.debug("📉 Downscaled image from %s to %s", original_size, image.size)
+                return part["data"], part["mime_type"]
+        except Exception as e:
+            logger.warning("⚠️ Downscale failed, sending original image: %s", e)
+            return image_bytes, mime_type
+    
+    def process_image_stream(self, image_path: str, prompt: str = None, image_bytes: bytes = None, mime_type: str = None,
+                             downscale: bool = False) -> Iterator[str]:
+        """
+        Stream the Gemini analysis of an image as text chunks.
+        
+        Use build_result with the joined chunks to get the same dictionary
+        process_image returns.
+        
+        Args:
+            image_path: Path to the image file (used as the image name when image_bytes is given)
+            prompt: Optional custom prompt for image analysis
+            image_bytes: Optional in-memory image data to process instead of reading image_path
+            mime_type: MIME type of image_bytes (e.g. "image/jpeg")
+            downscale: Shrink image_bytes to max_image_edge before sending them; the cache
+                lookup (like build_result) still uses the original bytes
+            
+        Yields:
+            Partial context text as it arrives from Gemini
+        """
+        if prompt is None:
+            prompt = DEFAULT_PROMPT
+        
+        # A cached analysis arrives as a single chunk
+        raw = self._read_image_bytes(image_path, image_bytes)
+        _, cached = self._lookup_cache(image_path, prompt, raw)
+        if cached:
+            yield cached["context"]
+            return
+        
+        with self._open_image(image_path, raw) as image:
+            logger.info("🤖 Streaming image analysis from Gemini API...")
+            send_bytes, send_mime = image_bytes, mime_type
+            if downscale and image_bytes is not None:
+                send_bytes, send_mime = self.downscale_image_bytes(image_bytes, mime_type)
+            try:
+                response = self._call_gemini_with_retry([prompt, self._image_part(image, send_bytes, send_mime, raw)], stream=True)
+            except Exception as gemini_error:
+                logger.error("❌ Gemini API error: %s", gemini_error)
+                response = self._call_gemini_with_retry([prompt, self._fallback_request_part(image, image_bytes, raw)], stream=True)
+            
+            for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+    
+    def build_result(self, image_path: str, context: str, prompt: str = None, image_bytes: bytes = None) -> Dict[str, Any]:
+        """
+        Build the result dictionary for a context produced by process_image_stream.
+        
+        Args:
+            image_path: Path to the image file (used as the image name when image_bytes is given)
+            context: Full context text returned by Gemini
+            prompt: Prompt used for the analysis
+            image_bytes: Optional in-memory image data the context was produced from
+            
+        Returns:
+            Dictionary containing image context and metadata
+        """
+        if prompt is None:
+            prompt = DEFAULT_PROMPT
+        
+        # Reuse the cached result (and its ImageKit upload) when the stream was served from it
+        raw = self._read_image_bytes(image_path, image_bytes)
+        cache_key, cached = self._lookup_cache(image_path, prompt, raw)
+        if cached and cached.get("context") == context:
+            return cached
+        
+        result = self._build_success_result(image_path, self._image_meta(image_path, raw), prompt, context, image_bytes)
+        if cache_key:
+            self.result_cache.put(cache_key, result)
+        return result
+    
+    def _read_image_bytes(self, image_path: str, image_bytes: bytes = None) -> bytes:
+        """Return the in-memory image data if given, otherwise read the file in one go."""
+        if image_bytes is not None:
+            return image_bytes
+        return Path(image_path).read_bytes()
+    
+    def _image_size(self, image: Image.Image) -> Dict[str, Any]:
+        """Size info recorded in the result dictionary."""
+        return {
+            "width": image.width,
+            "height": image.height,
+            "format": image.format or "Unknown"
+        }
+    
+    def _image_meta(self, image_path: str, image_bytes: bytes = None) -> Dict[str, Any]:
+        """
+        Read an image's size info from its header alone.
+        
+        Image.open only parses the header, and nothing here touches the pixels,
+        so no decode happens and the file is closed straight away.
+        """
+        with self._open_image(image_path, image_bytes) as image:
+            return self._image_size(image)
+    
+    def _open_image(self, image_path: str, image_bytes: bytes = None) -> Image.Image:
+        """Open an image from in-memory bytes if given, otherwise from disk (header only until pixels are read)."""
+        if image_bytes is not None:
+            return Image.open(io.BytesIO(image_bytes))
+        return Image.open(image_path)
+    
+    def _image_part(self, image: Image.Image, image_bytes: bytes = None, mime_type: str = None, raw: bytes = None) -> Any:
+        """
+        Build the image part of a Gemini request.
+        
+        In-memory uploads are already encoded, so their original bytes are sent
+        with the declared MIME type instead of letting the SDK re-encode the
+        decoded PIL image. Files read from disk are sent the same way (raw being
+        their bytes) when they are in a format Gemini accepts and don't need
+        downscaling. Downscaled images are sent as JPEG (PNG if they have
+        transparency); anything else is handed to the SDK as a PIL image.
+        """
+        if image_bytes is not None:
+            return {"mime_type": mime_type or Image.MIME.get(image.format, "image/png"), "data": image_bytes}
+        upload_image = self._prepare_for_upload(image, raw)
+        if upload_image is not image:
+            # The SDK would keep PNG sources as PNG, several times larger than a JPEG of a photo
+            with upload_image:
+                return _encode_upload_part(upload_image)
+        if raw is not None and image.format in GEMINI_IMAGE_FORMATS:
+            return {"mime_type": Image.MIME[image.format], "data": raw}
+        return upload_image
+    
+    async def _image_part_async(self, image: Image.Image, image_bytes: bytes = None, mime_type: str = None,
+                                raw: bytes = None, executor: Executor = None) -> Any:
+        """
+        Async version of _image_part.
+        
+        Downscaling decodes and resizes the whole image, so it runs off the event
+        loop: in executor (e.g. a process pool) when given, otherwise on a thread.
+        """
+        if image_bytes is not None or max(image.size) <= self.max_image_edge:
+            return self._image_part(image, image_bytes, mime_type, raw)
+        if executor is None or raw is None:
+            return await asyncio.to_thread(self._image_part, image, image_bytes, mime_type, raw)
+        
+        part, size = await asyncio.get_running_loop().run_in_executor(executor, _downscale_image_part, raw, self.max_image_edge)
+        logger.debug("📉 Downscaled image from %s to %s for upload", image.size, size)
+        return part
+    
+    def _prepare_for_upload(self, image: Image.Image, raw: bytes = None) -> Image.Image:
+        """
+        Downscale an on-disk image to at most max_image_edge on its longest side.
+        
+        The image is re-opened (from raw, the file's bytes, when given) so the
+        caller's image (used for the reported size) is left untouched; small
+        images are returned as-is.
+        """
+        max_edge = self.max_image_edge
+        if max(image.size) <= max_edge:
+            return image
+        if raw is not None:
+            resized = Image.open(io.BytesIO(raw))
+        elif getattr(image, "filename", None):
+            resized = Image.open(image.filename)
+        else:
+            return image
+        
+        _shrink_image(resized, max_edge)
+        logger.debug("📉 Downscaled image from %s to %s for upload", image.size, resized.size)
+        return resized
+    
+    def _build_success_result(self, image_path: str, image_size: Dict[str, Any], prompt: str, context: str, image_bytes: bytes = None,
+                              timestamp: str = None, upload: Optional[Future] = None) -> Dict[str, Any]:
+        """
+        Upload the image to ImageKit and assemble the success result dictionary.
+        
+        If upload (from _start_imagekit_upload) is given, its result is used
+        instead of uploading now.
+        """
+        # Upload to ImageKit if service is available
+        if upload is not None:
+            imagekit_result = upload.result()
+        else:
+            imagekit_result = self._upload_to_imagekit(image_path, image_bytes)
+        
+        # Create result dictionary
+        return {
+            "timestamp": timestamp or datetime.now().isoformat(),
+            "image_path": image_path,
+            "image_name": os.path.basename(image_path),
+            "image_size": image_size,
+            "prompt_id": self._store_prompt(prompt),
+            "context": context,
+            "processing_status": "success",
+            "imagekit": imagekit_result
+        }
+    
+    def _upload_to_imagekit(self, image_path: str, image_bytes: bytes = None) -> Optional[Dict[str, Any]]:
+        """Upload an image to ImageKit for its result, or return None if the service isn't available."""
+        if not self.imagekit_service:
+            return None
+        try:
+            if image_bytes is not None:
+                imagekit_result = self.imagekit_service.upload_image_from_bytes(image_bytes, os.path.basename(image_path))
+            else:
+                imagekit_result = self.imagekit_service.upload_image(image_path)
+            logger.debug("📤 ImageKit upload result: %s", imagekit_result.get('success', False))
+        except Exception as upload_error:
+            logger.warning("⚠️ ImageKit upload failed: %s", upload_error)
+            imagekit_result = {"success": False, "error": str(upload_error)}
+        return imagekit_result
+    
+    def _start_imagekit_upload(self, image_path: str, image_bytes: bytes = None) -> Optional[Future]:
+        """
+        Start the ImageKit upload in the background so it overlaps the Gemini request.
+        
+        Returns:
+            Future resolving to the upload result, or None if the service isn't available
+        """
+        if not self.imagekit_service:
+            return None
+        return self._io_pool.submit(self._upload_to_imagekit, image_path, image_bytes)
+    
+    def _discard_imagekit_upload(self, upload: Optional[Future]):
+        """
+        Delete an early upload once it finishes, for an image whose analysis failed.
+        
+        Only files this upload actually created are deleted; a result from the upload
+        cache ("cached") is the file earlier results already point to, so it is kept.
+        """
+        if upload is None:
+            return
+        
+        def delete(future: Future):
+            imagekit_result = future.result()
+            if (imagekit_result and imagekit_result.get("success") and imagekit_result.get("imagekit_id")
+                    and not imagekit_result.get("cached")):
+                self.imagekit_service.delete_image(imagekit_result["imagekit_id"])
+        
+        upload.add_done_callback(delete)
+    
+    def _store_prompt(self, prompt: str) -> str:
+        """
+        Record a prompt's text once and return its ID.
+        
+        Results reference prompts by ID instead of repeating the (multi-KB) text
+        in every result; the text lives in prompts/<id>.txt under the output dir.
+        
+        Args:
+            prompt: Prompt sent with the image
+            
+        Returns:
+            Short hex ID of the prompt
+        """
+        prompt_id = self._prompt_ids.get(prompt)
+        if prompt_id is not None:
+            return prompt_id
+        
+        prompt_id = hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).hexdigest()
+        
+        prompt_path = os.path.join(self.prompts_dir, f"{prompt_id}.txt")
+        try:
+            if not os.path.exists(prompt_path):
+                os.makedirs(self.prompts_dir, exist_ok=True)
+                # Write then rename so concurrent workers never see a partial prompt
+                tmp_path = f"{prompt_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                Path(tmp_path).write_text(prompt, encoding="utf-8")
+                os.replace(tmp_path, prompt_path)
+            self._prompt_ids[prompt] = prompt_id
+        except Exception as e:
+            logger.warning("⚠️ Failed to store prompt %s: %s", prompt_id, e)
+        return prompt_id
+    
+    def get_prompt(self, prompt_id: str) -> Optional[str]:
+        """
+        Look up the text of a prompt recorded by ID in a result.
+        
+        Args:
+            prompt_id: Value of a result's "prompt_id" field
             
-            return {
-                "timestamp": datetime.now().isoformat(),
-                "image_path": image_path,
-                "image_name": os.path.basename(image_path),
-                "image_size": image_size,
-                "error": str(e),
-                "processing_status": "failed",
-                "context": f"Processing failed: {str(e)}"
-            }
+        Returns:
+            The prompt text, or None if it is unknown
+        """
+        try:
+            return Path(self.prompts_dir, f"{prompt_id}.txt").read_text(encoding="utf-8")
+        except (OSError, ValueError):
+            return None
     
-    def save_to_json(self, result: Dict[str, Any], filename: str = None) -> str:
+    def save_to_json(self, result: Dict[str, Any], filename: str = None, pretty: bool = True) -> str:
         """
         Save the processing result to a JSON file.
         
         Args:
             result: The result dictionary from process_image
             filename: Optional custom filename, defaults to timestamp-based name
+            pretty: Indent the JSON for reading; False writes compact JSON
             
         Returns:
             Path to the saved JSON file
         """
+        filepath, _ = self.save_to_json_with_payload(result, filename, pretty)
+        return filepath
+    
+    def save_to_json_with_payload(self, result: Dict[str, Any], filename: str = None,
+                                  pretty: bool = True) -> Tuple[str, bytes]:
+        """
+        Save the processing result to a JSON file and return the serialized bytes.
+        
+        Args:
+            result: The result dictionary from process_image
+            filename: Optional custom filename, defaults to timestamp-based name
+            pretty: Indent the JSON for reading; False writes compact JSON
+            
+        Returns:
+            Tuple of (path to the saved JSON file, JSON bytes that were written)
+        """
         if filename is None:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"image_context_{timestamp}.json"
@@ -482,9 +1228,11 @@ Rate event identification confidence:
         filepath = os.path.join(self.output_dir, filename)
         
         try:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(result, f, indent=2, ensure_ascii=False)
-            return filepath
+            payload = json_utils.dumps(result, indent=pretty)
+            # A crash mid-write leaves the previous file (or none), never a truncated document
+            json_utils.write_atomic(filepath, payload)
+            self.history_index.append(filename, filepath, result)
+            return filepath, payload
         except Exception as e:
             raise Exception(f"Failed to save JSON file: {str(e)}")
     
@@ -503,7 +1251,10 @@ Rate event identification confidence:
         result = self.process_image(image_path, prompt)
         return self.save_to_json(result, filename)
     
-    def process_multiple_images(self, image_paths: list, prompt: str = None, batch_filename: str = None) -> Dict[str, Any]:
+    def process_multiple_images(self, image_paths: list, prompt: str = None, batch_filename: str = None,
+                                concurrency: int = 8, requests_per_second: float = None,
+                                images_per_request: int = 1, preprocess_workers: int = 0,
+                                no_cache: bool = False) -> Dict[str, Any]:
         """
         Process multiple images and return a comprehensive batch result.
         
@@ -511,12 +1262,51 @@ Rate event identification confidence:
             image_paths: List of image file paths
             prompt: Optional custom prompt for image analysis
             batch_filename: Optional custom filename for the batch JSON output
+            concurrency: Maximum number of Gemini requests in flight at once
+            requests_per_second: Optional cap on how fast new Gemini requests are started
+            images_per_request: Number of images sent together in one Gemini request
+            preprocess_workers: Number of worker processes that downscale large images (0 for none)
+            no_cache: Skip the result cache, re-analysing every image
             
         Returns:
             Dictionary containing batch processing results
         """
+        return self._run_async(self.process_multiple_images_async(
+            image_paths, prompt, batch_filename, concurrency, requests_per_second, images_per_request,
+            preprocess_workers, no_cache
+        ))
+    
+    async def process_multiple_images_async(self, image_paths: list, prompt: str = None, batch_filename: str = None,
+                                            concurrency: int = 8, requests_per_second: float = None,
+                                            images_per_request: int = 1, preprocess_workers: int = 0,
+                                            no_cache: bool = False) -> Dict[str, Any]:
+        """
+        Process multiple images concurrently and return a comprehensive batch result.
+        
+        Args:
+            image_paths: List of image file paths
+            prompt: Optional custom prompt for image analysis
+            batch_filename: Optional custom filename for the batch JSON output
+            concurrency: Maximum number of Gemini requests in flight at once
+            requests_per_second: Optional cap on how fast new Gemini requests are started
+            images_per_request: Number of images sent together in one Gemini request (at most
+                MAX_IMAGES_PER_REQUEST); with more than one, the response is split per image
+                (falling back to one request per image if it can't be)
+            preprocess_workers: Number of worker processes (capped at the CPU count) that decode
+                and downscale large images in parallel while other requests are in flight; 0 keeps
+                that work on a thread. Workers are spawned, so scripts need the usual
+                `if __name__ == "__main__":` guard
+            no_cache: Skip the result cache, re-analysing every image
+            
+        Returns:
+            Dictionary containing batch processing results, with images in input order
+        """
+        # One wall-clock timestamp for the whole batch; images record a monotonic offset from it
+        started_at = time.monotonic()
+        batch_timestamp = datetime.now().isoformat()
+        
         batch_result = {
-            "batch_timestamp": datetime.now().isoformat(),
+            "batch_timestamp": batch_timestamp,
             "total_images": len(image_paths),
             "successful_images": 0,
             "failed_images": 0,
@@ -525,33 +1315,64 @@ Rate event identification confidence:
             "processing_status": "processing"
         }
         
-        print(f"🔄 Processing batch of {len(image_paths)} images...")
+        logger.info("🔄 Processing batch of %s images...", len(image_paths))
         
-        for i, image_path in enumerate(image_paths, 1):
-            print(f"📸 Processing image {i}/{len(image_paths)}: {os.path.basename(image_path)}")
-            
-            try:
-                # Process individual image
-                result = self.process_image(image_path, prompt)
-                batch_result["images"].append(result)
-                
-                if result["processing_status"] == "success":
-                    batch_result["successful_images"] += 1
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        limiter = AsyncRateLimiter(requests_per_second) if requests_per_second else None
+        
+        # Spawned rather than forked: this process already runs gRPC and event loop threads
+        executor = None
+        if preprocess_workers > 0:
+            executor = ProcessPoolExecutor(max_workers=min(preprocess_workers, os.cpu_count() or 1),
+                                           mp_context=multiprocessing.get_context("spawn"))
+        
+        group_size = min(max(1, images_per_request), MAX_IMAGES_PER_REQUEST)
+        groups = [image_paths[start:start + group_size] for start in range(0, len(image_paths), group_size)]
+        
+        async def bounded(i, group):
+            async with semaphore:
+                if len(group) == 1:
+                    logger.debug("📸 Processing image %s/%s: %s", i, len(image_paths), os.path.basename(group[0]))
+                    group_results = [await self.process_image_async(group[0], prompt, limiter=limiter, timestamp=batch_timestamp,
+                                                                    executor=executor, no_cache=no_cache)]
                 else:
-                    batch_result["failed_images"] += 1
-                    
-            except Exception as e:
-                print(f"❌ Error processing {image_path}: {str(e)}")
-                error_result = {
-                    "timestamp": datetime.now().isoformat(),
+                    logger.debug("📸 Processing images %s-%s/%s in one request", i, i + len(group) - 1, len(image_paths))
+                    group_results = await self._process_image_group_async(group, prompt, limiter, batch_timestamp, executor, no_cache)
+                elapsed_ms = int((time.monotonic() - started_at) * 1000)
+                for result in group_results:
+                    result["elapsed_ms"] = elapsed_ms
+                return group_results
+        
+        try:
+            group_results = await asyncio.gather(
+                *(bounded(start * group_size + 1, group) for start, group in enumerate(groups)),
+                return_exceptions=True
+            )
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False)
+        results = []
+        for group, group_result in zip(groups, group_results):
+            results.extend(group_result if not isinstance(group_result, Exception) else [group_result] * len(group))
+        
+        for image_path, result in zip(image_paths, results):
+            if isinstance(result, Exception):
+                logger.error("❌ Error processing %s: %s", image_path, result)
+                result = {
+                    "timestamp": batch_timestamp,
                     "image_path": image_path,
                     "image_name": os.path.basename(image_path),
                     "image_size": {"width": 0, "height": 0, "format": "Unknown"},
-                    "error": str(e),
+                    "error": str(result),
                     "processing_status": "failed",
-                    "context": f"Processing failed: {str(e)}"
+                    "context": f"Processing failed: {str(result)}"
                 }
-                batch_result["images"].append(error_result)
+            
+            batch_result["images"].append(result)
+            
+            if result["processing_status"] == "success":
+                batch_result["successful_images"] += 1
+            else:
                 batch_result["failed_images"] += 1
         
         # Generate batch summary
@@ -562,127 +1383,393 @@ Rate event identification confidence:
             batch_result["processing_status"] = "failed"
             batch_result["batch_summary"] = f"Failed to process any images out of {batch_result['total_images']} total"
         
-        print(f"✅ Batch processing completed: {batch_result['successful_images']} successful, {batch_result['failed_images']} failed")
+        logger.info("✅ Batch processing completed: %s successful, %s failed", batch_result['successful_images'], batch_result['failed_images'])
         
         return batch_result
     
+    async def _process_image_group_async(self, image_paths: list, prompt: str = None,
+                                         limiter: "AsyncRateLimiter" = None, timestamp: str = None,
+                                         executor: Executor = None, no_cache: bool = False) -> list:
+        """
+        Analyse several images with a single Gemini request.
+        
+        Cached images are answered from the cache; the rest are sent together,
+        each preceded by an "===IMAGE n===" label that Gemini is asked to repeat,
+        and the response is split back on those labels. If the request fails or
+        the response can't be split, each image is processed on its own.
+        
+        Args:
+            image_paths: Image file paths sent in one request
+            prompt: Optional custom prompt for image analysis
+            limiter: Optional rate limiter awaited before each Gemini call
+            timestamp: Optional precomputed ISO timestamp to record
+            executor: Optional executor (e.g. a process pool) that downscales large images
+            no_cache: Skip the result cache, neither reading nor storing a cached result
+            
+        Returns:
+            List of result dictionaries, in the order of image_paths
+        """
+        if prompt is None:
+            prompt = DEFAULT_PROMPT
+        
+        results = [None] * len(image_paths)
+        pending = []
+        try:
+            for i, image_path in enumerate(image_paths):
+                try:
+                    raw = self._read_image_bytes(image_path)
+                    cache_key, cached = self._lookup_cache(image_path, prompt, raw, timestamp, no_cache)
+                    if cached:
+                        results[i] = cached
+                        continue
+                    pending.append((i, cache_key, self._open_image(image_path, raw), raw))
+                except Exception as e:
+                    results[i] = self._failure_result(image_path, e, timestamp=timestamp)
+            
+            if len(pending) > 1:
+                logger.debug("🤖 Sending %s images to Gemini API in one request...", len(pending))
+                try:
+                    parts = await asyncio.gather(*(
+                        self._image_part_async(image, raw=raw, executor=executor) for _, _, image, raw in pending
+                    ))
+                    contents = [prompt, MULTI_IMAGE_PROMPT.format(count=len(pending))]
+                    for n, part in enumerate(parts, 1):
+                        contents += [f"===IMAGE {n}===", part]
+                    response = await self._call_gemini_with_retry_async(contents, limiter)
+                    logger.debug("✅ Gemini API response received (%s characters)", len(response.text))
+                    contexts = self._split_group_response(response.text, len(pending))
+                except Exception as gemini_error:
+                    logger.error("❌ Gemini API error: %s", gemini_error)
+                    contexts = None
+                
+                if contexts is not None:
+                    for (i, cache_key, image, _), context in zip(pending, contexts):
+                        # The ImageKit upload is blocking network I/O, keep it off the event loop
+                        results[i] = await asyncio.to_thread(self._build_success_result, image_paths[i], self._image_size(image),
+                                                             prompt, context,
+                                                             None, timestamp)
+                        if cache_key:
+                            self.result_cache.put(cache_key, results[i])
+                    return results
+                
+                logger.info("🔄 Falling back to one request per image...")
+        finally:
+            for _, _, image, _ in pending:
+                image.close()
+        
+        # Zero or one image left to send, or the grouped response couldn't be used
+        singles = await asyncio.gather(*(
+            self.process_image_async(image_paths[i], prompt, limiter=limiter, timestamp=timestamp, executor=executor,
+                                     no_cache=no_cache)
+            for i, _, _, _ in pending
+        ))
+        for (i, _, _, _), result in zip(pending, singles):
+            results[i] = result
+        return results
+    
+    def _split_group_response(self, text: str, count: int) -> Optional[list]:
+        """
+        Split a multi-image response on its "===IMAGE n===" labels.
+        
+        Returns:
+            One context per image, or None unless labels 1..count each appear once, in order,
+            with a non-empty analysis after them
+        """
+        labels = list(IMAGE_LABEL_PATTERN.finditer(text))
+        if [int(label.group(1)) for label in labels] != list(range(1, count + 1)):
+            logger.warning("⚠️ Could not split grouped response into %s analyses", count)
+            return None
+        
+        ends = [label.start() for label in labels[1:]] + [len(text)]
+        contexts = [text[label.end():end].strip() for label, end in zip(labels, ends)]
+        if not all(contexts):
+            logger.warning("⚠️ Grouped response is missing an analysis")
+            return None
+        return contexts
+    
+    def _run_async(self, coro):
+        """
+        Run a coroutine to completion from synchronous code.
+        
+        Gemini's async client keeps a gRPC channel bound to the event loop it
+        was first used on, so every call goes through one long-lived loop on a
+        background thread instead of a fresh asyncio.run() loop each time.
+        This also works when the caller already has a running loop.
+        """
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="gemini-async", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+    
     def save_batch_to_json(self, batch_result: Dict[str, Any], filename: str = None) -> str:
         """
-        Save batch processing results to a JSON file, appending to existing if available.
+        Append batch processing results to a JSON Lines batch log.
+        
+        Each batch is written as one line, so a save costs the same however
+        much history has built up; running totals are kept in history_meta.json.
+        With zstandard installed the log is stored zstd-compressed (.jsonl.zst).
         
         Args:
             batch_result: The batch result dictionary from process_multiple_images
             filename: Optional custom filename, defaults to consistent history file
             
         Returns:
-            Path to the saved JSON file
+            Path to the batch log file
         """
-        if filename is None:
-            filename = "image_analysis_history.json"  # Use consistent filename for all batches
+        filename = self._batch_log_filename(filename)
+        filepath = os.path.join(self.output_dir, filename)
         
-        # Ensure filename has .json extension
-        if not filename.endswith('.json'):
-            filename += '.json'
+        try:
+            stats = self._append_batches(filename, [batch_result])
+        except Exception as e:
+            logger.error("❌ Error saving batch JSON file: %s", e)
+            raise Exception(f"Failed to save batch JSON file: {str(e)}")
+        
+        logger.info("✅ Batch results appended to: %s", filepath)
+        logger.info("📊 Total batches: %s, Total images: %s", stats['total_batches'], stats['total_images_processed'])
+        return filepath
+    
+    def load_batch_history(self, filename: str = None) -> Dict[str, Any]:
+        """
+        Assemble a batch log into a single history document.
         
+        Args:
+            filename: Batch log name (a legacy .json or plain .jsonl name maps to its current log)
+            
+        Returns:
+            Dictionary with 'batches', 'total_images_processed' and 'last_updated'
+        """
+        filename = self._batch_log_filename(filename)
         filepath = os.path.join(self.output_dir, filename)
         
-        # Load existing data if file exists
-        existing_data = {"batches": [], "total_images_processed": 0, "last_updated": ""}
-        if os.path.exists(filepath):
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    loaded_data = json.load(f)
-                    
-                    # Check if this is the new format (with 'batches' array)
-                    if isinstance(loaded_data, dict) and "batches" in loaded_data and isinstance(loaded_data["batches"], list):
-                        print(f"✅ Loading existing new-format data with {len(loaded_data['batches'])} batches")
-                        existing_data = loaded_data
-                    
-                    # Check if this is the old format (with 'images' array directly)
-                    elif isinstance(loaded_data, dict) and "images" in loaded_data and isinstance(loaded_data["images"], list):
-                        print(f"🔄 Migrating old-format data to new format")
-                        # Convert old format to new format
-                        existing_data = {
-                            "batches": [loaded_data],  # Wrap the old data as the first batch
-                            "total_images_processed": loaded_data.get("total_images", 0),
-                            "last_updated": loaded_data.get("batch_timestamp", datetime.now().isoformat())
-                        }
-                        print(f"✅ Migrated old format: {len(existing_data['batches'])} batches, {existing_data['total_images_processed']} images")
-                    
-                    else:
-                        print(f"⚠️ Existing file has unrecognized structure, starting fresh")
-                        existing_data = {"batches": [], "total_images_processed": 0, "last_updated": ""}
-                        
-            except Exception as e:
-                print(f"⚠️ Error reading existing file: {e}, starting fresh")
-                existing_data = {"batches": [], "total_images_processed": 0, "last_updated": ""}
-        
-        # Ensure the existing_data has the required structure
-        if "batches" not in existing_data or not isinstance(existing_data["batches"], list):
-            existing_data["batches"] = []
-        if "total_images_processed" not in existing_data:
-            existing_data["total_images_processed"] = 0
-        if "last_updated" not in existing_data:
-            existing_data["last_updated"] = ""
-        
-        # Add new batch to existing data
-        batch_result["batch_id"] = len(existing_data["batches"]) + 1
-        existing_data["batches"].append(batch_result)
-        existing_data["total_images_processed"] += batch_result.get("total_images", 0)
-        existing_data["last_updated"] = datetime.now().isoformat()
-        
-        # Save updated data back to file
-        try:
-            # Validate the data structure before saving
-            if not isinstance(existing_data, dict):
-                raise ValueError("existing_data must be a dictionary")
-            if "batches" not in existing_data or not isinstance(existing_data["batches"], list):
-                raise ValueError("existing_data must have a 'batches' list")
+        batches = list(self._iter_batch_log(filepath))
+        stats = self._load_history_meta().get(filename, {})
+        
+        return {
+            "batches": batches,
+            "total_images_processed": stats.get("total_images_processed", sum(b.get("total_images", 0) for b in batches)),
+            "last_updated": stats.get("last_updated", "")
+        }
+    
+    def iter_batch_history_json(self, filename: str = None) -> Iterator[bytes]:
+        """
+        Stream a batch log as the JSON encoding of load_batch_history's document.
+        
+        Each stored batch line is passed through as-is rather than decoded into
+        one big document and re-encoded, so memory stays bounded by a batch.
+        
+        Args:
+            filename: Batch log name (a legacy .json or plain .jsonl name maps to its current log)
+            
+        Yields:
+            Consecutive chunks of the JSON document
+        """
+        filename = self._batch_log_filename(filename)
+        filepath = os.path.join(self.output_dir, filename)
+        stats = self._load_history_meta().get(filename, {})
+        
+        yield b'{"batches":['
+        total_images = 0
+        for i, (line, batch) in enumerate(self._iter_batch_log_lines(filepath)):
+            total_images += batch.get("total_images", 0)
+            yield line if i == 0 else b"," + line
+        yield b'],' + json_utils.dumps({
+            "total_images_processed": stats.get("total_images_processed", total_images),
+            "last_updated": stats.get("last_updated", "")
+        })[1:]
+    
+    def read_batch(self, batch_id: int, filename: str = None) -> Optional[Dict[str, Any]]:
+        """
+        Load one batch from a batch log, reading it line by line.
+        
+        Args:
+            batch_id: ID of the batch to load
+            filename: Batch log name, defaults to the consistent history file
+            
+        Returns:
+            The batch result dictionary, or None if the log has no such batch
+        """
+        filepath = os.path.join(self.output_dir, self._batch_log_filename(filename))
+        for batch in self._iter_batch_log(filepath):
+            if batch.get("batch_id") == batch_id:
+                return batch
+        return None
+    
+    def batch_log_path(self, filename: str = None) -> str:
+        """
+        Map a batch history filename to the path of the log that stores it.
+        
+        Args:
+            filename: Batch log name or its old .json name, defaults to the consistent history file
+            
+        Returns:
+            Path to the batch log in the output directory (which may not exist)
+        """
+        return os.path.join(self.output_dir, self._batch_log_filename(filename))
+    
+    def _batch_log_filename(self, filename: str = None) -> str:
+        """Normalize a batch history filename to its batch log name."""
+        if not filename:
+            return BATCH_HISTORY_FILENAME
+        return batch_log.log_filename(filename)
+    
+    def _append_batches(self, filename: str, batches: list, keep_ids: bool = False) -> Dict[str, Any]:
+        """
+        Append batches to a batch log and update its totals in history_meta.json.
+        
+        Args:
+            filename: Batch log name
+            batches: Batch result dictionaries to append
+            keep_ids: Keep batch_id values already present (used when migrating)
+            
+        Returns:
+            Updated totals for the log
+        """
+        filepath = os.path.join(self.output_dir, filename)
+        
+        with self._batch_log_lock:
+            meta = self._load_history_meta()
+            stats = meta.get(filename)
+            if stats is None or not os.path.exists(filepath):
+                stats = self._count_batch_log(filepath)
+            elif "log_size" in stats:
+                # Recover from a crash mid-append before writing after it
+                for line in batch_log.repair(filepath, stats["log_size"]).splitlines():
+                    if line.strip():
+                        stats["total_batches"] += 1
+                        stats["total_images_processed"] += json_utils.loads(line).get("total_images", 0)
             
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(existing_data, f, indent=2, ensure_ascii=False)
+            lines = []
+            for batch in batches:
+                if not keep_ids or "batch_id" not in batch:
+                    batch["batch_id"] = stats["total_batches"] + 1
+                stats["total_batches"] += 1
+                stats["total_images_processed"] += batch.get("total_images", 0)
+                lines.append(json_utils.dumps(batch) + b"\n")
+            stats["last_updated"] = datetime.now().isoformat()
             
-            print(f"✅ Batch results appended to: {filepath}")
-            print(f"📊 Total batches: {len(existing_data['batches'])}, Total images: {existing_data['total_images_processed']}")
-            print(f"🔍 Data structure validation passed")
-            return filepath
+            batch_log.append(filepath, b"".join(lines))
+            stats["log_size"] = os.path.getsize(filepath)
+            
+            meta[filename] = stats
+            self._write_history_meta(meta)
+            self.history_index.append(filename, filepath, stats)
+        
+        return stats
+    
+    def _load_history_meta(self) -> Dict[str, Any]:
+        """Load the per-log totals, keyed by batch log filename."""
+        try:
+            with open(os.path.join(self.output_dir, HISTORY_META_FILENAME), 'rb') as f:
+                meta = json_utils.loads(f.read())
+            return meta if isinstance(meta, dict) else {}
+        except FileNotFoundError:
+            return {}
         except Exception as e:
-            print(f"❌ Error saving batch JSON file: {str(e)}")
-            print(f"🔍 existing_data structure: {type(existing_data)}")
-            if isinstance(existing_data, dict):
-                print(f"🔍 existing_data keys: {list(existing_data.keys())}")
-            raise Exception(f"Failed to save batch JSON file: {str(e)}")
+            logger.warning("⚠️ Error reading history meta, recounting: %s", e)
+            return {}
+    
+    def _write_history_meta(self, meta: Dict[str, Any]):
+        """Replace history_meta.json atomically (callers hold _batch_log_lock)."""
+        json_utils.write_atomic(os.path.join(self.output_dir, HISTORY_META_FILENAME), json_utils.dumps(meta))
+    
+    def _count_batch_log(self, filepath: str) -> Dict[str, Any]:
+        """Recompute the totals of a batch log (used when history_meta.json has no entry for it)."""
+        stats = {"total_batches": 0, "total_images_processed": 0, "last_updated": ""}
+        for batch in self._iter_batch_log(filepath):
+            stats["total_batches"] += 1
+            stats["total_images_processed"] += batch.get("total_images", 0)
+        return stats
+    
+    def _iter_batch_log(self, filepath: str) -> Iterator[Dict[str, Any]]:
+        """Yield the batches of a batch log one line at a time."""
+        for _, batch in self._iter_batch_log_lines(filepath):
+            yield batch
     
-    def copy_image_to_uploads(self, image_path: str) -> str:
+    def _iter_batch_log_lines(self, filepath: str) -> Iterator[Tuple[bytes, Dict[str, Any]]]:
+        """Yield (stripped JSON line, decoded batch) for each readable batch of a batch log."""
+        if not os.path.exists(filepath):
+            return
+        with batch_log.open_lines(filepath) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    batch = json_utils.loads(line)
+                except json_utils.JSONDecodeError as e:
+                    logger.warning("⚠️ Skipping unreadable line in %s: %s", os.path.basename(filepath), e)
+                    continue
+                if isinstance(batch, dict):
+                    yield line, batch
+    
+    def _unique_upload_name(self, image_name: str) -> str:
+        """Unique file name for an image stored in uploads."""
+        name, ext = os.path.splitext(os.path.basename(image_name))
+        return f"{name}_{self._session_tag}_{next(self._upload_counter):06d}{ext}"
+    
+    def copy_image_to_uploads(self, image_path: str, image_name: str = None) -> str:
         """
         Copy an image to the uploads directory with a unique filename.
         
         Args:
             image_path: Path to the source image file
+            image_name: Name to base the upload's file name on (defaults to the source file's)
             
         Returns:
             Path to the copied image in uploads directory
         """
         try:
             # Generate unique filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            original_name = os.path.basename(image_path)
-            name, ext = os.path.splitext(original_name)
-            unique_filename = f"{name}_{timestamp}{ext}"
+            upload_path = os.path.join(self.uploads_dir, self._unique_upload_name(image_name or image_path))
             
-            upload_path = os.path.join(self.uploads_dir, unique_filename)
+            # Copy the image as cheaply as the filesystem allows
+            method = self._link_or_copy(image_path, upload_path)
             
-            # Copy the image
-            import shutil
-            shutil.copy2(image_path, upload_path)
-            
-            print(f"💾 Image copied to uploads: {upload_path}")
+            logger.debug("💾 Image copied to uploads (%s): %s", method, upload_path)
             return upload_path
             
         except Exception as e:
-            print(f"❌ Error copying image to uploads: {str(e)}")
+            logger.error("❌ Error copying image to uploads: %s", e)
             return image_path  # Return original path if copy fails
     
+    def _link_or_copy(self, src: str, dst: str) -> str:
+        """
+        Put a copy of src at dst without moving data when possible.
+        
+        Tries a hardlink (same filesystem, no data written), then
+        os.copy_file_range (lets Linux reflink or copy in-kernel), then
+        shutil.copyfile. Only the data is copied; uploads get fresh timestamps
+        and permissions, so no extra stat/utime/chmod calls are made.
+        
+        Returns:
+            The method used: "hardlink", "copy_file_range" or "copy"
+        """
+        try:
+            os.link(src, dst)
+            return "hardlink"
+        except OSError:
+            pass
+        
+        if hasattr(os, "copy_file_range"):
+            try:
+                with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                    remaining = os.fstat(fsrc.fileno()).st_size
+                    while remaining > 0:
+                        copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                        if copied == 0:
+                            break
+                        remaining -= copied
+                if remaining == 0:
+                    return "copy_file_range"
+            except OSError:
+                pass
+        
+        # Uses sendfile on Linux and fcopyfile on macOS
+        shutil.copyfile(src, dst)
+        return "copy"
+    
     def upload_to_imagekit(self, image_path: str, folder: str = "photo-context") -> Dict[str, Any]:
         """
         Upload an image to ImageKit.
@@ -735,26 +1822,19 @@ Rate event identification confidence:
     
     def get_processing_history(self) -> list:
         """Get list of all processed JSON files."""
-        json_files = []
-        for file in os.listdir(self.output_dir):
-            if file.endswith('.json'):
-                filepath = os.path.join(self.output_dir, file)
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        json_files.append({
-                            "filename": file,
-                            "filepath": filepath,
-                            "timestamp": data.get("timestamp", "Unknown"),
-                            "image_name": data.get("image_name", "Unknown"),
-                            "status": data.get("processing_status", "Unknown")
-                        })
-                except Exception:
-                    continue
+        return self.history_index.load()
+    
+    def get_image_stats(self) -> Dict[str, Any]:
+        """
+        Count the stored image analyses by status and format.
         
-        # Sort by timestamp (newest first)
-        json_files.sort(key=lambda x: x["timestamp"], reverse=True)
-        return json_files
+        Answered from the search index's columns, so no result JSON is parsed.
+        
+        Returns:
+            Dictionary with 'total_images', 'by_status' and 'by_format'
+        """
+        self._sync_search_index()
+        return self.search_index.stats()
     
     def search_images_by_description(self, search_query: str, max_results: int = 5) -> list:
         """
@@ -767,138 +1847,127 @@ Rate event identification confidence:
         Returns:
             List of matching images with relevance scores
         """
-        print(f"🔍 AI-powered search for: '{search_query}'")
+        logger.info("🔍 AI-powered search for: '%s'", search_query)
         
         # AI search is now implemented - this will use Gemini 2.5 Pro for semantic understanding
         # The old keyword search logic is preserved as fallback in case AI search fails
-        search_results = []
+        search_results = [self._search_result(*match) for match in self._top_keyword_matches(search_query, max_results)]
         
-        # Search through all JSON files, prioritizing the new format
-        json_files = []
-        for file in os.listdir(self.output_dir):
-            if file.endswith('.json'):
-                json_files.append(file)
-        
-        # Sort files to prioritize image_analysis_history.json (new format)
-        json_files.sort(key=lambda x: (x != "image_analysis_history.json", x))
-        
-        for file in json_files:
-            filepath = os.path.join(self.output_dir, file)
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        
-                        # Handle new batch structure with 'batches' array
-                        if 'batches' in data and isinstance(data['batches'], list):
-                            # New batch structure - search through all batches
-                            for batch_index, batch in enumerate(data['batches']):
-                                if 'images' in batch and isinstance(batch['images'], list):
-                                    for img_data in batch['images']:
-                                        relevance_score = self._calculate_relevance(img_data, search_query)
-                                        if relevance_score > 0:
-                                            search_results.append({
-                                                'image_name': img_data.get('image_name', 'Unknown'),
-                                                'image_path': img_data.get('image_path', 'Unknown'),
-                                                'upload_path': img_data.get('upload_path', 'Unknown'),
-                                                'context': img_data.get('context', ''),
-                                                'image_size': img_data.get('image_size', {}),
-                                                'timestamp': img_data.get('timestamp', 'Unknown'),
-                                                'relevance_score': relevance_score,
-                                                'source_file': file,
-                                                'processing_status': img_data.get('processing_status', 'Unknown'),
-                                                'batch_id': batch.get('batch_id', batch_index + 1)
-                                            })
-                        # Handle legacy batch structure with 'images' array
-                        elif 'images' in data and isinstance(data['images'], list):
-                            # Legacy batch result - search through individual images
-                            for img_data in data['images']:
-                                relevance_score = self._calculate_relevance(img_data, search_query)
-                                if relevance_score > 0:
-                                    search_results.append({
-                                        'image_name': img_data.get('image_name', 'Unknown'),
-                                        'image_path': img_data.get('image_path', 'Unknown'),
-                                        'upload_path': img_data.get('upload_path', 'Unknown'),
-                                        'context': img_data.get('context', ''),
-                                        'image_size': img_data.get('image_size', {}),
-                                        'timestamp': img_data.get('timestamp', 'Unknown'),
-                                        'relevance_score': relevance_score,
-                                        'source_file': file,
-                                        'processing_status': img_data.get('processing_status', 'Unknown'),
-                                        'batch_id': 'Legacy'
-                                    })
-                        else:
-                            # Single image result
-                            relevance_score = self._calculate_relevance(data, search_query)
-                            if relevance_score > 0:
-                                search_results.append({
-                                    'image_name': data.get('image_name', 'Unknown'),
-                                    'image_path': data.get('image_path', 'Unknown'),
-                                    'upload_path': data.get('upload_path', 'Unknown'),
-                                    'context': data.get('context', ''),
-                                    'image_size': data.get('image_size', {}),
-                                    'timestamp': data.get('timestamp', 'Unknown'),
-                                    'relevance_score': relevance_score,
-                                    'source_file': file,
-                                    'processing_status': data.get('processing_status', 'Unknown'),
-                                    'batch_id': 'Single'
-                                })
-                                
-            except Exception as e:
-                print(f"⚠️ Error reading {file}: {str(e)}")
-                continue
-        
-        # Sort by relevance score (highest first) and limit results
-        search_results.sort(key=lambda x: x['relevance_score'], reverse=True)
-        search_results = search_results[:max_results]
-        
-        print(f"✅ Found {len(search_results)} relevant images")
+        logger.info("✅ Found %s relevant images", len(search_results))
         return search_results
     
-    def _calculate_relevance(self, image_data: dict, search_query: str) -> float:
+    @staticmethod
+    def _search_result(relevance_score: float, img_data: Dict[str, Any], source_file: str, batch_id: Any) -> Dict[str, Any]:
+        """Format one stored image as a search result (keyword or AI)."""
+        return {
+            'image_name': img_data.get('image_name', 'Unknown'),
+            'image_path': img_data.get('image_path', 'Unknown'),
+            'upload_path': img_data.get('upload_path', 'Unknown'),
+            'context': img_data.get('context', ''),
+            'image_size': img_data.get('image_size', {}),
+            'timestamp': img_data.get('timestamp', 'Unknown'),
+            'relevance_score': relevance_score,
+            'source_file': source_file,
+            'processing_status': img_data.get('processing_status', 'Unknown'),
+            'batch_id': batch_id
+        }
+    
+    def _top_keyword_matches(self, search_query: str, max_results: int) -> list:
         """
-        Calculate relevance score between image data and search query.
+        Score the candidate images in one pass and keep only the best ones.
         
         Args:
-            image_data: Image data dictionary
-            search_query: Search query string
+            search_query: Natural language description to search for
+            max_results: Maximum number of matches to return
             
         Returns:
-            Relevance score (0.0 to 1.0)
+            List of (relevance score, image data, source file, batch id), highest score first
+        """
+        query_words = self._compile_query(search_query)
+        if not query_words:
+            return []
+        
+        # Matches only change when the index does, so a repeated query is answered from memory
+        self._sync_search_index()
+        return self._cached_keyword_matches(tuple(query_words), max_results, self.search_index.generation)
+    
+    def _score_keyword_matches(self, query_words: Tuple[str, ...], max_results: int, generation: int) -> list:
+        """
+        Uncached body of _top_keyword_matches, for an already synced index.
+        
+        Args:
+            query_words: Lowercase query words
+            max_results: Maximum number of matches to return
+            generation: Search index generation the matches are computed for (part of the cache key)
         """
-        if not search_query or not image_data:
-            return 0.0
+        query_phrase = f" {' '.join(query_words)} "
+        
+        # Word and name matches are counted by SQLite over the postings; only images
+        # sharing a word with the query (or matching it by name) come back
+        counts = self.search_index.match_counts(list(query_words), BATCH_HISTORY_FILENAME)
+        if not counts:
+            # Nothing shares a word with the query or matches it by name, so there is nothing to score
+            return []
         
-        # Convert to lowercase for comparison
-        query_lower = search_query.lower()
-        context_lower = image_data.get('context', '').lower()
-        image_name_lower = image_data.get('image_name', '').lower()
+        # A phrase can only match where every word did, so only those images need their terms
+        full_matches = [image_id for image_id, matching, _ in counts if matching == len(query_words)]
+        phrases = {}
+        if len(query_words) > 1 and full_matches:
+            phrases = {image_id: terms[1] for image_id, terms in self.search_index.terms(full_matches).items()}
         
-        # Check if query words appear in context
-        query_words = query_lower.split()
-        context_words = context_lower.split()
+        scored = (
+            (_relevance_score(len(query_words), matching, query_phrase in phrases.get(image_id, ""), name_match), image_id)
+            for image_id, matching, name_match in counts
+        )
+        
+        # nlargest keeps a heap of max_results entries instead of sorting every match,
+        # and like the stable sort it replaces, ties keep their file order
+        top = heapq.nlargest(max_results, (match for match in scored if match[0] > 0), key=lambda match: match[0])
+        
+        # Only the images returned are loaded
+        rows = self.search_index.rows([image_id for _, image_id in top])
+        return [(score, *row) for (score, _), row in zip(top, rows)]
+    
+    def _iter_image_records(self, limit: int = None) -> Iterator[Tuple[Dict[str, Any], str, Any]]:
+        """
+        Yield (image data, source file, batch id) for stored analyses.
         
-        # Calculate word overlap
-        matching_words = sum(1 for word in query_words if word in context_words)
-        word_relevance = matching_words / len(query_words) if query_words else 0.0
+        Records come from the search index, which is first brought up to date
+        with the result files on disk.
         
-        # Check for exact phrase matches
-        phrase_relevance = 0.0
-        if len(query_words) > 1:
-            # Check for consecutive word matches
-            for i in range(len(context_words) - len(query_words) + 1):
-                if context_words[i:i+len(query_words)] == query_words:
-                    phrase_relevance = 1.0
-                    break
+        Args:
+            limit: Stop after this many images
+        """
+        self._sync_search_index()
         
-        # Check image name relevance
-        name_relevance = 0.0
-        if any(word in image_name_lower for word in query_words):
-            name_relevance = 0.5
+        # The default batch log (new format) is listed first
+        return self.search_index.records(BATCH_HISTORY_FILENAME, limit)
+    
+    def _sync_search_index(self):
+        """Bring the search index up to date with the result files on disk."""
+        index_filename = self.history_index.filename
+        with os.scandir(self.output_dir) as it:
+            files = {
+                entry.name: entry.stat() for entry in it
+                if ((entry.name.endswith('.json') and entry.name != HISTORY_META_FILENAME)
+                    or (batch_log.is_batch_log(entry.name) and entry.name != index_filename))
+                and entry.is_file()
+            }
         
-        # Weighted combination
-        final_score = (word_relevance * 0.6) + (phrase_relevance * 0.3) + (name_relevance * 0.1)
+        # Empty files hold no records
+        self.search_index.sync({name: stat for name, stat in files.items() if stat.st_size > 0})
+    
+    def _compile_query(self, search_query: str) -> list:
+        """
+        Split a search query into the words it is scored on.
         
-        return min(final_score, 1.0)
+        Args:
+            search_query: Search query string
+            
+        Returns:
+            Lowercase query words
+        """
+        return search_query.lower().split() if search_query else []
     
     def _ai_semantic_search(self, search_query: str, max_results: int) -> list:
         """
@@ -911,84 +1980,52 @@ Rate event identification confidence:
         Returns:
             List of matching images with AI-calculated relevance scores
         """
-        print(f"🤖 Using Gemini 2.5 Pro for semantic search...")
+        logger.info("🤖 Using Gemini 2.5 Pro for semantic search...")
         
-        # Collect all available image data for AI analysis
-        all_images = self._collect_all_image_data()
+        # Only the images shown in the prompt can be ranked, so only those are loaded
+        all_images = self._collect_all_image_data(limit=AI_SEARCH_PROMPT_IMAGES)
         
         if not all_images:
-            print("⚠️ No images found for AI search")
+            logger.warning("⚠️ No images found for AI search")
             return []
         
         # Create a comprehensive prompt for AI analysis
-        ai_prompt = self._create_search_prompt(search_query, all_images, max_results)
+        ai_prompt = self._create_search_prompt(search_query, all_images, max_results, self.search_index.count())
         
         try:
             # Use Gemini to analyze and rank images
             ai_response = self._query_gemini_for_search(ai_prompt)
             ranked_results = self._parse_ai_search_response(ai_response, all_images, max_results)
             
-            print(f"🤖 AI analysis completed. Returning {len(ranked_results)} results")
+            logger.info("🤖 AI analysis completed. Returning %s results", len(ranked_results))
             return ranked_results
             
         except Exception as e:
-            print(f"❌ AI search failed: {str(e)}")
+            logger.error("❌ AI search failed: %s", e)
             raise e
     
-    def _collect_all_image_data(self) -> list:
+    def _collect_all_image_data(self, limit: int = None) -> list:
         """
         Collect all available image data from JSON files.
         
+        Args:
+            limit: Collect at most this many images (in the usual file order)
+            
         Returns:
             List of image data dictionaries
         """
         all_images = []
         
-        # Search through all JSON files
-        json_files = []
-        for file in os.listdir(self.output_dir):
-            if file.endswith('.json'):
-                json_files.append(file)
-        
-        # Sort files to prioritize image_analysis_history.json (new format)
-        json_files.sort(key=lambda x: (x != "image_analysis_history.json", x))
-        
-        for file in json_files:
-            filepath = os.path.join(self.output_dir, file)
-            try:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                    # Handle new batch structure with 'batches' array
-                    if 'batches' in data and isinstance(data['batches'], list):
-                        for batch_index, batch in enumerate(data['batches']):
-                            if 'images' in batch and isinstance(batch['images'], list):
-                                for img_data in batch['images']:
-                                    img_data['source_file'] = file
-                                    img_data['batch_id'] = batch.get('batch_id', batch_index + 1)
-                                    all_images.append(img_data)
-                    
-                    # Handle legacy batch structure with 'images' array
-                    elif 'images' in data and isinstance(data['images'], list):
-                        for img_data in data['images']:
-                            img_data['source_file'] = file
-                            img_data['batch_id'] = 'Legacy'
-                            all_images.append(img_data)
-                    
-                    else:
-                        # Single image result
-                        data['source_file'] = file
-                        data['batch_id'] = 'Single'
-                        all_images.append(data)
-                        
-            except Exception as e:
-                print(f"⚠️ Error reading {file}: {str(e)}")
-                continue
+        for img_data, source_file, batch_id in self._iter_image_records(limit):
+            img_data['source_file'] = source_file
+            img_data['batch_id'] = batch_id
+            all_images.append(img_data)
         
-        print(f"📊 Collected {len(all_images)} images for AI analysis")
+        logger.debug("📊 Collected %s images for AI analysis", len(all_images))
         return all_images
     
-    def _create_search_prompt(self, search_query: str, all_images: list, max_results: int) -> str:
+    def _create_search_prompt(self, search_query: str, all_images: list, max_results: int,
+                              total_images: int = None) -> str:
         """
         Create a comprehensive prompt for AI-powered image search.
         
@@ -996,22 +2033,23 @@ Rate event identification confidence:
             search_query: User's search query
             all_images: List of all available images
             max_results: Maximum number of results to return
+            total_images: Number of stored images, when all_images holds only the first ones
             
         Returns:
             Formatted prompt string for Gemini
         """
-        # Create a summary of available images
-        image_summary = []
-        for i, img in enumerate(all_images[:50]):  # Limit to first 50 for prompt efficiency
-            context_preview = img.get('context', '')[:200] + '...' if len(img.get('context', '')) > 200 else img.get('context', '')
-            image_summary.append(f"Image {i+1}: {img.get('image_name', 'Unknown')} - {context_preview}")
+        # Create a summary of available images (limited for prompt efficiency)
+        image_summary = "\n".join(
+            f"Image {i+1}: {img.get('image_name', 'Unknown')} - {_context_preview(img.get('context', ''))}"
+            for i, img in enumerate(islice(all_images, AI_SEARCH_PROMPT_IMAGES))
+        )
         
         prompt = f"""You are an expert AI image search assistant. Your task is to find the most relevant images based on a user's search query.
 
 SEARCH QUERY: "{search_query}"
 
-AVAILABLE IMAGES ({len(all_images)} total):
-{chr(10).join(image_summary)}
+AVAILABLE IMAGES ({total_images if total_images is not None else len(all_images)} total):
+{image_summary}
 
 TASK: Analyze the search query and rank the images by relevance. Consider:
 1. Semantic meaning and context
@@ -1061,13 +2099,13 @@ Analyze the search query and return the most relevant images in the specified JS
             response = model.generate_content(prompt)
             
             if response and response.text:
-                print(f"🤖 Gemini response received: {len(response.text)} characters")
+                logger.debug("🤖 Gemini response received: %s characters", len(response.text))
                 return response.text
             else:
                 raise Exception("Empty response from Gemini")
                 
         except Exception as e:
-            print(f"❌ Gemini API error: {str(e)}")
+            logger.error("❌ Gemini API error: %s", e)
             raise e
     
     def _parse_ai_search_response(self, ai_response: str, all_images: list, max_results: int) -> list:
@@ -1083,14 +2121,9 @@ Analyze the search query and return the most relevant images in the specified JS
             List of formatted search results
         """
         try:
-            # Try to extract JSON from the response
-            import re
-            
             # Find JSON content in the response
-            json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                ai_data = json.loads(json_str)
+            ai_data = json_utils.find_object(ai_response)
+            if ai_data is not None:
                 
                 results = []
                 if 'results' in ai_data and isinstance(ai_data['results'], list):
@@ -1102,30 +2135,23 @@ Analyze the search query and return the most relevant images in the specified JS
                         if 0 <= image_index < len(all_images):
                             img_data = all_images[image_index]
                             
-                            results.append({
-                                'image_name': img_data.get('image_name', 'Unknown'),
-                                'image_path': img_data.get('image_path', 'Unknown'),
-                                'upload_path': img_data.get('upload_path', 'Unknown'),
-                                'context': img_data.get('context', ''),
-                                'image_size': img_data.get('image_size', {}),
-                                'timestamp': img_data.get('timestamp', 'Unknown'),
-                                'relevance_score': relevance_score,
-                                'source_file': img_data.get('source_file', 'Unknown'),
-                                'processing_status': img_data.get('processing_status', 'Unknown'),
-                                'batch_id': img_data.get('batch_id', 'Unknown'),
-                                'ai_reasoning': reasoning
-                            })
+                            result = self._search_result(
+                                relevance_score, img_data,
+                                img_data.get('source_file', 'Unknown'), img_data.get('batch_id', 'Unknown')
+                            )
+                            result['ai_reasoning'] = reasoning
+                            results.append(result)
                 
                 # Sort by AI relevance score and limit results
                 results.sort(key=lambda x: x['relevance_score'], reverse=True)
                 return results[:max_results]
             
             else:
-                print("⚠️ No JSON found in AI response, using fallback")
+                logger.warning("⚠️ No JSON found in AI response, using fallback")
                 raise Exception("Invalid AI response format")
                 
         except Exception as e:
-            print(f"❌ Error parsing AI response: {str(e)}")
+            logger.error("❌ Error parsing AI response: %s", e)
             raise e
     
     def _fallback_keyword_search(self, search_query: str, max_results: int) -> list:
@@ -1139,33 +2165,14 @@ Analyze the search query and return the most relevant images in the specified JS
         Returns:
             List of formatted search results
         """
-        print(f"🔍 Using fallback keyword search...")
+        logger.info("🔍 Using fallback keyword search...")
         
         search_results = []
         
-        # Collect all images
-        all_images = self._collect_all_image_data()
-        
-        for img_data in all_images:
-            relevance_score = self._calculate_relevance(img_data, search_query)
-            if relevance_score > 0:
-                search_results.append({
-                    'image_name': img_data.get('image_name', 'Unknown'),
-                    'image_path': img_data.get('image_path', 'Unknown'),
-                    'upload_path': img_data.get('upload_path', 'Unknown'),
-                    'context': img_data.get('context', ''),
-                    'image_size': img_data.get('image_size', {}),
-                    'timestamp': img_data.get('timestamp', 'Unknown'),
-                    'relevance_score': relevance_score,
-                    'source_file': img_data.get('source_file', 'Unknown'),
-                    'processing_status': img_data.get('processing_status', 'Unknown'),
-                    'batch_id': img_data.get('batch_id', 'Unknown'),
-                    'ai_reasoning': 'Keyword-based fallback search'
-                })
-        
-        # Sort by relevance score (highest first) and limit results
-        search_results.sort(key=lambda x: x['relevance_score'], reverse=True)
-        search_results = search_results[:max_results]
-        
-        print(f"✅ Fallback search completed. Found {len(search_results)} relevant images")
+        for match in self._top_keyword_matches(search_query, max_results):
+            result = self._search_result(*match)
+            result['ai_reasoning'] = 'Keyword-based fallback search'
+            search_results.append(result)
+        
+        logger.info("✅ Fallback search completed. Found %s relevant images", len(search_results))
         return search_results
@@ -1,26 +1,199 @@
 import os
-from typing import Dict, Any, Optional
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import cached_property, lru_cache
+from itertools import islice
+from operator import attrgetter
+from typing import BinaryIO, Dict, Any, Iterator, List, Optional, Tuple
 from imagekitio import ImageKit
+from imagekitio.constants.errors import ERRORS
+from imagekitio.constants.url import URL
+from imagekitio.models.ListAndSearchFileRequestOptions import ListAndSearchFileRequestOptions
+from imagekitio.models.results.UploadFileResult import UploadFileResult
+from imagekitio.utils.utils import convert_to_response_object, general_api_throw_exception
 import requests
-from PIL import Image
+from requests_toolbelt import MultipartEncoder
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from PIL import Image, ImageOps
 import io
+from upload_cache import UploadCache
+
+logger = logging.getLogger(__name__)
+
+# Result key -> SDK attribute for the fields every file result is reported with
+RESULT_FIELDS = (
+    ("imagekit_url", "url"),
+    ("imagekit_id", "file_id"),
+    ("file_name", "name"),
+    ("file_size", "size"),
+    ("file_type", "file_type"),
+    ("folder", "folder_name"),
+    ("tags", "tags"),
+    ("metadata", "metadata"),
+    ("version_id", "version_id"),
+)
+_RESULT_KEYS = tuple(key for key, _ in RESULT_FIELDS)
+_get_result_fields = attrgetter(*(attribute for _, attribute in RESULT_FIELDS))
+
+def _result_fields(result: Any) -> Dict[str, Any]:
+    """
+    Read the RESULT_FIELDS of an SDK file result in one attrgetter call.
+    
+    The SDK's result models answer None for any field the response lacked
+    (they define __getattr__), so no per-field fallback is needed.
+    """
+    return dict(zip(_RESULT_KEYS, _get_result_fields(result)))
+
+# Leading bytes of the image formats uploads are sniffed for (WebP also has "WEBP" at offset 8)
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"RIFF", "image/webp"),
+    (b"BM", "image/bmp"),
+)
+
+# IMAGEKIT_TRANSCODE_TO value -> (Pillow format, MIME type, file extension)
+TRANSCODE_FORMATS = {"webp": ("WEBP", "image/webp", ".webp")}
+TRANSCODABLE_TYPES = frozenset(("image/png", "image/jpeg"))
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Get an image's MIME type from its first 12 bytes, or None if the format isn't recognized."""
+    for signature, mime_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            if mime_type == "image/webp" and head[8:12] != b"WEBP":
+                return None
+            return mime_type
+    return None
+
+# Most file IDs ImageKit accepts in one bulk delete request
+BULK_DELETE_LIMIT = 100
+
+# Latency samples kept per operation for get_latency_stats()
+LATENCY_SAMPLES = 4096
+
+# Most files ImageKit returns from one list_files call
+MAX_LIST_PAGE_SIZE = 1000
+
+# ImageKit URL parameter for each supported transformation, in URL order
+TRANSFORMATION_PREFIXES = (("width", "w"), ("height", "h"), ("quality", "q"), ("format", "f"), ("crop", "c"))
+
+@lru_cache(maxsize=1024)
+def _transform_segment(transformations: Tuple[Tuple[str, Any], ...]) -> str:
+    """Build the "tr:..." path segment for sorted (name, value) pairs, or "" if none apply."""
+    values = dict(transformations)
+    transform_parts = [f"{prefix}-{values[name]}" for name, prefix in TRANSFORMATION_PREFIXES if name in values]
+    return f"tr:{','.join(transform_parts)}" if transform_parts else ""
+
+def _transform_key(transformations: Dict[str, Any]) -> Tuple[Tuple[str, Any], ...]:
+    return tuple(sorted(transformations.items()))
 
 class ImageKitService:
-    def __init__(self):
-        """Initialize ImageKit service with credentials from environment variables."""
+    def __init__(self, cache_dir: str = None):
+        """
+        Initialize ImageKit service with credentials from environment variables.
+        
+        Args:
+            cache_dir: Directory for the record of uploaded file contents; when
+                given, re-uploading identical bytes returns the earlier upload
+        """
         self.imagekit_id = os.getenv("IMAGEKIT_ID",)
         self.url_endpoint = os.getenv("IMAGEKIT_URL_ENDPOINT",)
         self.public_key = os.getenv("IMAGEKIT_PUBLIC_KEY",)
         self.private_key = os.getenv("IMAGEKIT_PRIVATE_KEY", )
         
-        # Initialize ImageKit client
-        self.imagekit = ImageKit(
+        # The client itself is built on first use (URL helpers never need it), but
+        # missing credentials still fail here, as the SDK would at construction
+        if not (self.private_key and self.public_key and self.url_endpoint):
+            raise ValueError(ERRORS.MANDATORY_INITIALIZATION_MISSING.value)
+        
+        self.upload_cache = UploadCache(cache_dir) if cache_dir else None
+        
+        # Optional lossy re-encode of PNG/JPEG uploads (e.g. IMAGEKIT_TRANSCODE_TO=webp); off by default
+        self.transcode_to = os.getenv("IMAGEKIT_TRANSCODE_TO", "").strip().lower() or None
+        if self.transcode_to and self.transcode_to not in TRANSCODE_FORMATS:
+            logger.warning("⚠️ Ignoring unsupported IMAGEKIT_TRANSCODE_TO=%s (supported: %s)",
+                           self.transcode_to, ", ".join(TRANSCODE_FORMATS))
+            self.transcode_to = None
+        
+        # Recent request durations (ns) per operation; deque appends are atomic, so the
+        # upload threads record without a lock and old samples fall off the end
+        self._latencies = {operation: deque(maxlen=LATENCY_SAMPLES) for operation in ("upload", "delete", "bulk_delete", "details", "list")}
+        
+        # cached_property stopped locking in Python 3.12, and the upload threads can all reach
+        # the client and session first at once; this keeps each built once (see _build_once)
+        self._build_lock = threading.Lock()
+        
+        logger.info("✅ ImageKit service initialized for endpoint: %s", self.url_endpoint)
+    
+    def _build_once(self, name: str, build):
+        """Build a cached_property value under _build_lock, unless another thread just did."""
+        with self._build_lock:
+            if name not in self.__dict__:
+                self.__dict__[name] = build()
+            return self.__dict__[name]
+    
+    @cached_property
+    def imagekit(self) -> ImageKit:
+        """ImageKit client, created on first use and routed through the pooled session."""
+        return self._build_once("imagekit", self._build_imagekit)
+    
+    def _build_imagekit(self) -> ImageKit:
+        """Create the ImageKit client behind the imagekit property."""
+        imagekit = ImageKit(
             private_key=self.private_key,
             public_key=self.public_key,
             url_endpoint=self.url_endpoint
         )
+        imagekit.ik_request.request = self._request
         
-        print(f"✅ ImageKit service initialized for endpoint: {self.url_endpoint}")
+        # The private key never changes, so encode the Basic auth header once instead of
+        # on every SDK call; callers add to the headers they get, so each gets a copy
+        auth_headers = imagekit.ik_request.get_auth_headers()
+        default_headers = imagekit.ik_request.create_headers()
+        imagekit.ik_request.get_auth_headers = lambda: dict(auth_headers)
+        imagekit.ik_request.create_headers = lambda: dict(default_headers)
+        return imagekit
+    
+    @cached_property
+    def _session(self) -> requests.Session:
+        """
+        Pooled HTTP session for all ImageKit requests, created on first use.
+        
+        The SDK opens a new HTTPS connection for every call; sending its requests
+        through one session means TCP and TLS setup is paid once, not per upload.
+        Retries only cover connection errors and idempotent methods, so an upload
+        (a POST) is never sent twice.
+        """
+        return self._build_once("_session", self._build_session)
+    
+    def _build_session(self) -> requests.Session:
+        """Create the pooled session behind the _session property."""
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=32,
+            max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[429, 502, 503, 504])
+        ))
+        return session
+    
+    def _request(self, method, url, headers, params=None, files=None, data=None) -> requests.Response:
+        """Drop-in for the SDK's ImageKitRequest.request that reuses the pooled session."""
+        return self._session.request(
+            method=method,
+            url=url,
+            params=params,
+            files=files,
+            data=data,
+            headers=headers,
+        )
     
     def upload_image(self, image_path: str, folder: str = "photo-context") -> Dict[str, Any]:
         """
@@ -34,92 +207,227 @@ class ImageKitService:
             Dictionary containing upload result with ImageKit URL and metadata
         """
         try:
-            # Check if file exists
-            if not os.path.exists(image_path):
-                raise FileNotFoundError(f"Image file not found: {image_path}")
-            
-            # Get file info before reading
             file_name = os.path.basename(image_path)
-            file_size_on_disk = os.path.getsize(image_path)
-            print(f"📁 File info: {file_name} (Size on disk: {file_size_on_disk:,} bytes)")
             
-            # Read the image file with error checking
+            # Open first and stat the handle: one lookup instead of exists + getsize + open
             try:
-                with open(image_path, 'rb') as file:
-                    image_data = file.read()
-                    actual_read_size = len(image_data)
-                    print(f"📖 File read: {actual_read_size:,} bytes read from disk")
-                    
-                    if actual_read_size != file_size_on_disk:
-                        print(f"⚠️ Warning: Read size ({actual_read_size:,}) != Disk size ({file_size_on_disk:,})")
-                    
-                    if actual_read_size == 0:
-                        raise ValueError("File is empty or could not be read")
-                
-                # Verify file integrity by checking first and last few bytes
-                if actual_read_size > 100:
-                    first_bytes = image_data[:10].hex()
-                    last_bytes = image_data[-10:].hex()
-                    print(f"🔍 File integrity check: First 10 bytes: {first_bytes}, Last 10 bytes: {last_bytes}")
-                    
+                file = open(image_path, 'rb')
+            except FileNotFoundError:
+                raise FileNotFoundError(f"Image file not found: {image_path}")
             except Exception as read_error:
                 raise Exception(f"Failed to read file {image_path}: {str(read_error)}")
             
-            # Try simple upload first without complex options
-            print(f"📤 Uploading {file_name} to ImageKit...")
-            
-            # Upload to ImageKit without options for now
-            result = self.imagekit.upload_file(
-                file=image_data,
-                file_name=file_name
-            )
+            with file:
+                # Get file info before reading
+                file_size_on_disk = os.fstat(file.fileno()).st_size
+                logger.debug("📁 File info: %s (Size on disk: %s bytes)", file_name, file_size_on_disk)
+                
+                if file_size_on_disk == 0:
+                    raise ValueError("File is empty or could not be read")
+                
+                digest = UploadCache.digest_file(file) if self.upload_cache else None
+                cached = self._cached_upload(digest, file_name)
+                if cached:
+                    cached["local_path"] = image_path
+                    return cached
+                
+                body, upload_name, mime_type = self._upload_body(file, file_name, file_size_on_disk)
+                sent_size = file_size_on_disk if body is file else body.getbuffer().nbytes
+                logger.debug("📤 Uploading %s to ImageKit...", upload_name)
+                
+                # Streamed from the open file rather than read into memory first
+                with self._timed("upload"):
+                    result = self._upload_file_stream(body, upload_name, mime_type)
             
             # Check for errors in the result
             if hasattr(result, 'error') and result.error:
                 raise Exception(f"ImageKit upload failed: {result.error.message}")
             
-            # Debug: Print result object details
-            print(f"🔍 Upload result object type: {type(result)}")
-            print(f"🔍 Upload result attributes: {dir(result)}")
+            # Debug: Print result object details (dir() builds a sorted list, so only when shown)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("🔍 Upload result object type: %s", type(result))
+                logger.debug("🔍 Upload result attributes: %s", dir(result))
             
             # Extract upload details - handle both old and new result formats
-            uploaded_size = getattr(result, 'size', None)
-            if uploaded_size and uploaded_size != actual_read_size:
-                print(f"⚠️ Warning: Uploaded size ({uploaded_size:,}) != Original size ({actual_read_size:,})")
+            upload_result = {"success": True, **_result_fields(result)}
+            uploaded_size = upload_result["file_size"]
+            if uploaded_size and uploaded_size != sent_size:
+                logger.warning("⚠️ Warning: Uploaded size (%s) != Original size (%s)", uploaded_size, sent_size)
             
-            upload_result = {
-                "success": True,
-                "imagekit_url": getattr(result, 'url', None),
-                "imagekit_id": getattr(result, 'file_id', None),
-                "file_name": getattr(result, 'name', file_name),
-                "file_size": uploaded_size or actual_read_size,
-                "file_type": getattr(result, 'file_type', 'image/jpeg'),
-                "folder": getattr(result, 'folder_name', folder),
-                "tags": getattr(result, 'tags', ["photo-context", "ai-analysis"]),
-                "metadata": getattr(result, 'metadata', {}),
-                "version_id": getattr(result, 'version_id', None),
+            upload_result.update({
+                "file_size": uploaded_size or sent_size,
                 "local_path": image_path,
-                "original_size": actual_read_size,
+                "original_size": file_size_on_disk,
                 "uploaded_size": uploaded_size
-            }
+            })
             
-            print(f"✅ Image uploaded successfully to ImageKit")
+            logger.debug("✅ Image uploaded successfully to ImageKit")
             if upload_result["imagekit_url"]:
-                print(f"   URL: {upload_result['imagekit_url']}")
+                logger.debug("   URL: %s", upload_result['imagekit_url'])
             if upload_result["imagekit_id"]:
-                print(f"   ID: {upload_result['imagekit_id']}")
-            print(f"   Size: {upload_result['file_size']} bytes")
+                logger.debug("   ID: %s", upload_result['imagekit_id'])
+            logger.debug("   Size: %s bytes", upload_result['file_size'])
             
+            if digest:
+                self.upload_cache.put(digest, upload_result)
             return upload_result
             
         except Exception as e:
-            print(f"❌ ImageKit upload failed: {str(e)}")
+            logger.error("❌ ImageKit upload failed: %s", e)
             return {
                 "success": False,
                 "error": str(e),
                 "local_path": image_path
             }
     
+    @contextmanager
+    def _timed(self, operation: str):
+        """Record how long the wrapped ImageKit request took, whether or not it succeeded."""
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self._latencies[operation].append(time.perf_counter_ns() - start)
+    
+    def get_latency_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Summarize recent ImageKit request latencies.
+        
+        Upload results answered from the upload cache make no request and are
+        not counted.
+        
+        Returns:
+            Per operation ("upload", "delete", "bulk_delete", "details", "list") with samples: the
+            sample count and p50/p90/p99/max latency in milliseconds
+        """
+        stats = {}
+        for operation, samples in self._latencies.items():
+            values = sorted(samples)
+            if not values:
+                continue
+            
+            def percentile(fraction: float) -> float:
+                # Nearest-rank percentile, in ms
+                return round(values[min(len(values) - 1, int(len(values) * fraction))] / 1e6, 1)
+            
+            stats[operation] = {
+                "count": len(values),
+                "p50_ms": percentile(0.5),
+                "p90_ms": percentile(0.9),
+                "p99_ms": percentile(0.99),
+                "max_ms": round(values[-1] / 1e6, 1)
+            }
+        return stats
+    
+    def _cached_upload(self, digest: Optional[str], file_name: str) -> Optional[Dict[str, Any]]:
+        """Return the earlier upload of identical contents (marked "cached"), if there is one."""
+        if not digest:
+            return None
+        cached = self.upload_cache.get(digest)
+        if cached is None:
+            return None
+        logger.debug("⚡ %s already uploaded to ImageKit as %s, skipping", file_name, cached.get('imagekit_id'))
+        cached["cached"] = True
+        return cached
+    
+    def _upload_body(self, file: BinaryIO, file_name: str, size: int) -> Tuple[BinaryIO, str, Optional[str]]:
+        """
+        Decide what to send for an image file.
+        
+        The MIME type comes from the leading bytes (a few prefix comparisons, no
+        decode). With IMAGEKIT_TRANSCODE_TO set, PNG and JPEG images are
+        re-encoded, and the copy is sent instead when it is smaller.
+        
+        Args:
+            file: Image file opened in binary mode (left at its start)
+            file_name: Name of the image
+            size: Size of the file in bytes
+            
+        Returns:
+            Tuple of (file object to send, name to upload it under, MIME type or None)
+        """
+        head = file.read(12)
+        file.seek(0)
+        mime_type = sniff_image_type(head)
+        if not self.transcode_to or mime_type not in TRANSCODABLE_TYPES:
+            return file, file_name, mime_type
+        
+        pillow_format, target_type, extension = TRANSCODE_FORMATS[self.transcode_to]
+        try:
+            with Image.open(file) as source:
+                # Bake in the EXIF rotation, which the re-encoded copy would otherwise lose
+                image = ImageOps.exif_transpose(source)
+                if image.mode not in ("RGB", "RGBA"):
+                    image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+                transcoded = io.BytesIO()
+                image.save(transcoded, pillow_format, quality=82, method=4)
+        except Exception as e:
+            logger.warning("⚠️ Could not transcode %s, uploading the original: %s", file_name, e)
+            return file, file_name, mime_type
+        finally:
+            file.seek(0)
+        
+        if transcoded.tell() >= size:
+            logger.debug("📦 %s is not smaller as %s, uploading the original", file_name, self.transcode_to)
+            return file, file_name, mime_type
+        
+        logger.debug("📦 Transcoded %s to %s: %s -> %s bytes", file_name, self.transcode_to, size, transcoded.tell())
+        transcoded.seek(0)
+        return transcoded, os.path.splitext(file_name)[0] + extension, target_type
+    
+    def _upload_file_stream(self, file: BinaryIO, file_name: str, mime_type: str = None) -> UploadFileResult:
+        """
+        Upload an open file like ImageKit.upload_file, without buffering the body.
+        
+        The SDK builds the whole multipart body in memory (MultipartEncoder.read())
+        before sending it; handing requests the encoder itself sends the file in
+        chunks straight from disk. Headers, result parsing and errors are the SDK's.
+        
+        Args:
+            file: Image file opened in binary mode
+            file_name: Name for the uploaded file
+            mime_type: Content type of the file part, if known
+            
+        Returns:
+            The SDK's UploadFileResult
+        """
+        encoder = MultipartEncoder(fields={"file": (file_name, file, mime_type), "fileName": file_name})
+        headers = self.imagekit.ik_request.create_headers()
+        headers["Content-Type"] = encoder.content_type
+        
+        resp = self._session.post(f"{URL.UPLOAD_BASE_URL}/api/v1/files/upload", data=encoder, headers=headers)
+        if resp.status_code != 200:
+            general_api_throw_exception(resp)
+        return convert_to_response_object(resp, UploadFileResult)
+    
+    def upload_images_batch(self, image_paths: List[str], folder: str = "photo-context",
+                            concurrency: int = 5) -> List[Dict[str, Any]]:
+        """
+        Upload several images to ImageKit concurrently.
+        
+        Uploads are network bound, so a few run at once over the pooled session;
+        concurrency stays small to keep clear of ImageKit's rate limits.
+        
+        Args:
+            image_paths: Paths to the local image files
+            folder: Folder name in ImageKit (default: "photo-context")
+            concurrency: Maximum number of uploads in flight
+            
+        Returns:
+            One upload_image() result per path, in the same order
+        """
+        if not image_paths:
+            return []
+        
+        logger.info("📤 Uploading %s images to ImageKit (%s at a time)...", len(image_paths), concurrency)
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(image_paths)),
+                                thread_name_prefix="imagekit-batch") as executor:
+            results = list(executor.map(lambda path: self.upload_image(path, folder), image_paths))
+        
+        logger.info("✅ ImageKit batch upload finished: %s/%s succeeded",
+                    sum(1 for result in results if result.get("success")), len(results))
+        return results
+    
     def upload_image_from_bytes(self, image_bytes: bytes, filename: str, folder: str = "photo-context") -> Dict[str, Any]:
         """
         Upload an image to ImageKit from bytes data.
@@ -133,14 +441,17 @@ class ImageKitService:
             Dictionary containing upload result with ImageKit URL and metadata
         """
         try:
-            # Try simple upload first without complex options
-            print(f"📤 Uploading {filename} to ImageKit from bytes...")
+            digest = UploadCache.digest_bytes(image_bytes) if self.upload_cache else None
+            cached = self._cached_upload(digest, filename)
+            if cached:
+                cached["local_path"] = None
+                return cached
+            
+            body, upload_name, mime_type = self._upload_body(io.BytesIO(image_bytes), filename, len(image_bytes))
+            logger.debug("📤 Uploading %s to ImageKit from bytes...", upload_name)
             
-            # Upload to ImageKit without options for now
-            result = self.imagekit.upload_file(
-                file=image_bytes,
-                file_name=filename
-            )
+            with self._timed("upload"):
+                result = self._upload_file_stream(body, upload_name, mime_type)
             
             # Check for errors in the result
             if hasattr(result, 'error') and result.error:
@@ -149,28 +460,22 @@ class ImageKitService:
             # Extract upload details - handle both old and new result formats
             upload_result = {
                 "success": True,
-                "imagekit_url": getattr(result, 'url', None),
-                "imagekit_id": getattr(result, 'file_id', None),
-                "file_name": getattr(result, 'name', filename),
-                "file_size": getattr(result, 'size', len(image_bytes)),
-                "file_type": getattr(result, 'file_type', 'image/jpeg'),
-                "folder": getattr(result, 'folder_name', folder),
-                "tags": getattr(result, 'tags', ["photo-context", "ai-analysis"]),
-                "metadata": getattr(result, 'metadata', {}),
-                "version_id": getattr(result, 'version_id', None),
+                **_result_fields(result),
                 "local_path": None
             }
             
-            print(f"✅ Image uploaded successfully to ImageKit")
+            logger.debug("✅ Image uploaded successfully to ImageKit")
             if upload_result["imagekit_url"]:
-                print(f"   URL: {upload_result['imagekit_url']}")
+                logger.debug("   URL: %s", upload_result['imagekit_url'])
             if upload_result["imagekit_id"]:
-                print(f"   ID: {upload_result['imagekit_id']}")
+                logger.debug("   ID: %s", upload_result['imagekit_id'])
             
+            if digest:
+                self.upload_cache.put(digest, upload_result)
             return upload_result
             
         except Exception as e:
-            print(f"❌ ImageKit upload failed: {str(e)}")
+            logger.error("❌ ImageKit upload failed: %s", e)
             return {
                 "success": False,
                 "error": str(e),
@@ -188,14 +493,17 @@ class ImageKitService:
             Dictionary containing deletion result
         """
         try:
-            print(f"🗑️ Deleting image {imagekit_id} from ImageKit...")
-            result = self.imagekit.delete_file(imagekit_id)
+            logger.info("🗑️ Deleting image %s from ImageKit...", imagekit_id)
+            with self._timed("delete"):
+                result = self.imagekit.delete_file(imagekit_id)
             
             # Check for errors in the result
             if hasattr(result, 'error') and result.error:
                 raise Exception(f"ImageKit deletion failed: {result.error.message}")
             
-            print(f"✅ Image deleted successfully from ImageKit")
+            logger.info("✅ Image deleted successfully from ImageKit")
+            if self.upload_cache:
+                self.upload_cache.forget(imagekit_id)
             return {
                 "success": True,
                 "deleted_id": imagekit_id,
@@ -203,13 +511,62 @@ class ImageKitService:
             }
             
         except Exception as e:
-            print(f"❌ ImageKit deletion failed: {str(e)}")
+            logger.error("❌ ImageKit deletion failed: %s", e)
             return {
                 "success": False,
                 "error": str(e),
                 "imagekit_id": imagekit_id
             }
     
+    def delete_images(self, imagekit_ids: List[str]) -> Dict[str, Any]:
+        """
+        Delete several images from ImageKit with its bulk delete endpoint.
+        
+        IDs are sent BULK_DELETE_LIMIT per request, so N files take
+        ceil(N / 100) round trips instead of N.
+        
+        Args:
+            imagekit_ids: ImageKit file IDs to delete
+            
+        Returns:
+            Dictionary with the IDs that were deleted and those that were not
+        """
+        deleted, failed, errors = [], [], []
+        logger.info("🗑️ Deleting %s images from ImageKit...", len(imagekit_ids))
+        
+        for start in range(0, len(imagekit_ids), BULK_DELETE_LIMIT):
+            chunk = list(imagekit_ids[start:start + BULK_DELETE_LIMIT])
+            try:
+                with self._timed("bulk_delete"):
+                    result = self.imagekit.bulk_file_delete(chunk)
+                
+                # Check for errors in the result
+                if hasattr(result, 'error') and result.error:
+                    raise Exception(f"ImageKit deletion failed: {result.error.message}")
+                
+                chunk_deleted = set(result.successfully_deleted_file_ids or [])
+            except Exception as e:
+                logger.error("❌ ImageKit bulk deletion failed: %s", e)
+                errors.append(str(e))
+                chunk_deleted = set()
+            
+            for imagekit_id in chunk:
+                (deleted if imagekit_id in chunk_deleted else failed).append(imagekit_id)
+        
+        if self.upload_cache:
+            for imagekit_id in deleted:
+                self.upload_cache.forget(imagekit_id)
+        
+        logger.info("✅ Deleted %s/%s images from ImageKit", len(deleted), len(imagekit_ids))
+        result = {
+            "success": not failed,
+            "deleted_ids": deleted,
+            "failed_ids": failed
+        }
+        if errors:
+            result["error"] = "; ".join(errors)
+        return result
+    
     def get_image_info(self, imagekit_id: str) -> Dict[str, Any]:
         """
         Get information about an image stored in ImageKit.
@@ -221,8 +578,9 @@ class ImageKitService:
             Dictionary containing image information
         """
         try:
-            print(f"🔍 Getting info for image {imagekit_id}...")
-            result = self.imagekit.get_file_details(imagekit_id)
+            logger.info("🔍 Getting info for image %s...", imagekit_id)
+            with self._timed("details"):
+                result = self.imagekit.get_file_details(imagekit_id)
             
             # Check for errors in the result
             if hasattr(result, 'error') and result.error:
@@ -231,23 +589,15 @@ class ImageKitService:
             # Extract info - handle both old and new result formats
             image_info = {
                 "success": True,
-                "imagekit_url": getattr(result, 'url', None),
-                "imagekit_id": getattr(result, 'file_id', None),
-                "file_name": getattr(result, 'name', None),
-                "file_size": getattr(result, 'size', None),
-                "file_type": getattr(result, 'file_type', None),
-                "folder": getattr(result, 'folder_name', None),
-                "tags": getattr(result, 'tags', None),
-                "metadata": getattr(result, 'metadata', {}),
-                "version_id": getattr(result, 'version_id', None),
-                "created_at": getattr(result, 'created_at', None),
-                "updated_at": getattr(result, 'updated_at', None)
+                **_result_fields(result),
+                "created_at": result.created_at,
+                "updated_at": result.updated_at
             }
             
             return image_info
             
         except Exception as e:
-            print(f"❌ ImageKit info retrieval failed: {str(e)}")
+            logger.error("❌ ImageKit info retrieval failed: %s", e)
             return {
                 "success": False,
                 "error": str(e),
@@ -266,29 +616,8 @@ class ImageKitService:
             Dictionary containing list of images
         """
         try:
-            print(f"📋 Listing images in folder: {folder}")
-            result = self.imagekit.list_files({
-                "path": folder,
-                "limit": limit
-            })
-            
-            # Check for errors in the result
-            if hasattr(result, 'error') and result.error:
-                raise Exception(f"ImageKit listing failed: {result.error.message}")
-            
-            images = []
-            for file in result.list:
-                images.append({
-                    "imagekit_url": file.url,
-                    "imagekit_id": file.file_id,
-                    "file_name": file.name,
-                    "file_size": file.size,
-                    "file_type": file.file_type,
-                    "folder": file.folder_name,
-                    "tags": file.tags,
-                    "created_at": file.created_at,
-                    "updated_at": file.updated_at
-                })
+            logger.info("📋 Listing images in folder: %s", folder)
+            images = list(islice(self.iter_images(folder, page_size=min(limit, MAX_LIST_PAGE_SIZE)), limit))
             
             return {
                 "success": True,
@@ -298,13 +627,123 @@ class ImageKitService:
             }
             
         except Exception as e:
-            print(f"❌ ImageKit listing failed: {str(e)}")
+            logger.error("❌ ImageKit listing failed: %s", e)
             return {
                 "success": False,
                 "error": str(e),
                 "folder": folder
             }
     
+    def iter_images(self, folder: str = "photo-context", page_size: int = 100) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the images in a folder, one API page at a time.
+        
+        Only one page of results is held at once, and the next page is only
+        requested once the caller has consumed the current one, so large
+        folders list in constant memory and stopping early skips the rest.
+        
+        Args:
+            folder: Folder name to list (default: "photo-context")
+            page_size: Images requested per API call (ImageKit allows up to 1000)
+            
+        Yields:
+            One dictionary per image, as in list_images()
+        
+        Raises:
+            Exception: If ImageKit returns an error for a page
+        """
+        page_size = max(1, min(page_size, MAX_LIST_PAGE_SIZE))
+        skip = 0
+        while True:
+            with self._timed("list"):
+                result = self.imagekit.list_files(ListAndSearchFileRequestOptions(path=folder, limit=page_size, skip=skip))
+            
+            # Check for errors in the result
+            if hasattr(result, 'error') and result.error:
+                raise Exception(f"ImageKit listing failed: {result.error.message}")
+            
+            files = result.list or []
+            for file in files:
+                yield self._file_to_dict(file, folder)
+            
+            if len(files) < page_size:
+                return
+            skip += page_size
+    
+    @staticmethod
+    def _file_to_dict(file: Any, folder: str) -> Dict[str, Any]:
+        """Convert one SDK file result from list_files to the dictionary callers get."""
+        return {
+            "imagekit_url": file.url,
+            "imagekit_id": file.file_id,
+            "file_name": file.name,
+            "file_size": file.size,
+            "file_type": file.file_type,
+            # List results carry the file path rather than a folder name (missing attributes read as None)
+            "folder": getattr(file, 'folder_name', None) or folder,
+            "tags": file.tags,
+            "created_at": file.created_at,
+            "updated_at": file.updated_at
+        }
+    
+    # Async API: the blocking calls above run on worker threads, so an event loop can keep
+    # many uploads in flight while they share the pooled session's connections
+    
+    async def upload_image_async(self, image_path: str, folder: str = "photo-context") -> Dict[str, Any]:
+        """Async version of upload_image()."""
+        return await asyncio.to_thread(self.upload_image, image_path, folder)
+    
+    async def upload_image_from_bytes_async(self, image_bytes: bytes, filename: str,
+                                            folder: str = "photo-context") -> Dict[str, Any]:
+        """Async version of upload_image_from_bytes()."""
+        return await asyncio.to_thread(self.upload_image_from_bytes, image_bytes, filename, folder)
+    
+    async def upload_images_batch_async(self, image_paths: List[str], folder: str = "photo-context",
+                                        concurrency: int = 5) -> List[Dict[str, Any]]:
+        """
+        Async version of upload_images_batch().
+        
+        Args:
+            image_paths: Paths to the local image files
+            folder: Folder name in ImageKit (default: "photo-context")
+            concurrency: Maximum number of uploads in flight
+            
+        Returns:
+            One upload_image() result per path, in the same order
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        
+        async def bounded(image_path: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.upload_image_async(image_path, folder)
+        
+        return list(await asyncio.gather(*(bounded(image_path) for image_path in image_paths)))
+    
+    async def delete_image_async(self, imagekit_id: str) -> Dict[str, Any]:
+        """Async version of delete_image()."""
+        return await asyncio.to_thread(self.delete_image, imagekit_id)
+    
+    async def get_image_info_async(self, imagekit_id: str) -> Dict[str, Any]:
+        """Async version of get_image_info()."""
+        return await asyncio.to_thread(self.get_image_info, imagekit_id)
+    
+    async def list_images_async(self, folder: str = "photo-context", limit: int = 100) -> Dict[str, Any]:
+        """Async version of list_images()."""
+        return await asyncio.to_thread(self.list_images, folder, limit)
+    
+    def close(self):
+        """Close the pooled HTTP connections, if any were opened."""
+        with self._build_lock:
+            session = self.__dict__.pop("_session", None)
+        if session is not None:
+            session.close()
+    
+    async def __aenter__(self) -> "ImageKitService":
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        self.close()
+    
     def optimize_image_url(self, imagekit_url: str, transformations: Dict[str, Any] = None) -> str:
         """
         Generate an optimized ImageKit URL with transformations.
@@ -318,25 +757,29 @@ class ImageKitService:
         """
         if not transformations:
             return imagekit_url
+        return self._apply_transform(imagekit_url, _transform_segment(_transform_key(transformations)))
+    
+    def optimize_image_urls(self, imagekit_urls: List[str], transformations: Dict[str, Any] = None) -> List[str]:
+        """
+        Generate optimized ImageKit URLs for many images with the same transformations.
         
-        # Build transformation string
-        transform_parts = []
-        
-        if "width" in transformations:
-            transform_parts.append(f"w-{transformations['width']}")
-        if "height" in transformations:
-            transform_parts.append(f"h-{transformations['height']}")
-        if "quality" in transformations:
-            transform_parts.append(f"q-{transformations['quality']}")
-        if "format" in transformations:
-            transform_parts.append(f"f-{transformations['format']}")
-        if "crop" in transformations:
-            transform_parts.append(f"c-{transformations['crop']}")
-        
-        if transform_parts:
-            # Insert transformations before the filename
-            base_url = imagekit_url.rsplit('/', 1)[0]
-            filename = imagekit_url.rsplit('/', 1)[1]
-            return f"{base_url}/tr:{','.join(transform_parts)}/{filename}"
-        
-        return imagekit_url
+        Args:
+            imagekit_urls: Base ImageKit URLs
+            transformations: Dictionary of transformations to apply
+            
+        Returns:
+            Optimized ImageKit URLs, in the same order
+        """
+        if not transformations:
+            return list(imagekit_urls)
+        # The transformation segment is built once for the whole list
+        segment = _transform_segment(_transform_key(transformations))
+        return [self._apply_transform(imagekit_url, segment) for imagekit_url in imagekit_urls]
+    
+    @staticmethod
+    def _apply_transform(imagekit_url: str, segment: str) -> str:
+        """Insert a transformation segment before the filename of an ImageKit URL."""
+        base_url, separator, filename = imagekit_url.rpartition('/')
+        if not segment or not separator:
+            return imagekit_url
+        return f"{base_url}/{segment}/{filename}"
@@ -0,0 +1,121 @@
+"""
+JSON helpers that use orjson when it is installed and fall back to the standard library.
+"""
+
+import json
+import mmap
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Raised by loads on malformed input (orjson's error subclasses json.JSONDecodeError)
+JSONDecodeError = orjson.JSONDecodeError if orjson else json.JSONDecodeError
+
+# Files at least this large are memory-mapped by load_file instead of read into a copy
+MMAP_THRESHOLD = 1 << 20
+
+_decoder = json.JSONDecoder()
+
+def dumps(data, indent: bool = False, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """
+    Serialize data to UTF-8 JSON bytes.
+    
+    Args:
+        data: Object to serialize
+        indent: Pretty-print with two-space indentation
+        default: Called with objects that can't be serialized natively; returns a serializable stand-in
+        
+    Returns:
+        Encoded JSON bytes
+    """
+    if orjson:
+        # Non-str keys (e.g. ints) are stringified like the stdlib does instead of raising
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(data, default=default, option=option)
+    if indent:
+        return json.dumps(data, indent=2, ensure_ascii=False, default=default).encode('utf-8')
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=default).encode('utf-8')
+
+def write_atomic(path: str, data: bytes):
+    """
+    Replace a file's contents so readers see either the old or the new document, never part of one.
+    
+    The data is written and fsynced to a temporary file next to path, which is then
+    renamed over it with os.replace (atomic on POSIX and Windows).
+    
+    Args:
+        path: File to write
+        data: Full new contents
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def loads(data):
+    """
+    Parse JSON from bytes or str.
+    
+    Args:
+        data: JSON document
+        
+    Returns:
+        Parsed Python object
+    """
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def find_object(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse the first JSON object embedded in free text (e.g. a model reply).
+    
+    Each '{' is tried in turn and decoded only as far as its own closing
+    brace, so prose or stray braces after the object don't break it.
+    
+    Args:
+        text: Text containing a JSON object
+        
+    Returns:
+        The parsed object, or None if the text contains none
+    """
+    start = text.find('{')
+    while start != -1:
+        try:
+            return _decoder.raw_decode(text, start)[0]
+        except ValueError:
+            start = text.find('{', start + 1)
+    return None
+
+def load_file(path: str):
+    """
+    Parse a JSON document from a file.
+    
+    With orjson, files over MMAP_THRESHOLD are parsed straight from a memory
+    map, so the document is never copied into a bytes object first.
+    
+    Args:
+        path: JSON file to read
+        
+    Returns:
+        Parsed Python object
+    """
+    with open(path, 'rb') as f:
+        if orjson and os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                return orjson.loads(view)
+        return loads(f.read())
@@ -0,0 +1,42 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from typing import Optional
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def configure_logging(level: Optional[str] = None) -> logging.handlers.QueueListener:
+    """
+    Route log records to stdout through a queue.
+    
+    Callers only enqueue records; formatting and writing happen on the
+    listener's background thread, so logging never blocks processing.
+    Safe to call more than once (e.g. on Streamlit reruns).
+    
+    Args:
+        level: Log level name; defaults to the LOG_LEVEL environment variable, or INFO
+    
+    Returns:
+        The running queue listener
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    
+    handler = logging.StreamHandler(sys.stdout)
+    # Messages carry their own status emoji, so print them as-is
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+    
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    _listener.start()
+    # Flush whatever is still queued on exit
+    atexit.register(_listener.stop)
+    return _listener
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import logging
+import threading
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Optional
+import json_utils
+
+logger = logging.getLogger(__name__)
+
+# xxh3 hashes several GB/s; blake2b from the stdlib is the fallback
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+def new_hasher():
+    """Start a fast 128-bit content hash (xxh3 if available, else blake2b)."""
+    if xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.blake2b(digest_size=16)
+
+@lru_cache(maxsize=32)
+def _prompt_key_bytes(prompt: str) -> bytes:
+    """Encode a prompt for hashing; cached since nearly every call uses the same few prompts."""
+    prompt_bytes = prompt.encode("utf-8")
+    # Length prefix keeps image/prompt boundaries unambiguous
+    return len(prompt_bytes).to_bytes(8, "little") + prompt_bytes
+
+class ResultCache:
+    def __init__(self, cache_dir: str):
+        """
+        Content-addressed cache of successful Gemini results.
+        
+        Entries are keyed by a hash of the image bytes and the prompt, so the
+        same image is only analysed once per prompt, whatever its file name.
+        """
+        self.cache_dir = cache_dir
+    
+    def key(self, image_bytes: bytes, prompt: str) -> str:
+        """
+        Build the cache key for an image and prompt.
+        
+        Args:
+            image_bytes: Raw image file contents
+            prompt: Prompt sent with the image
+        
+        Returns:
+            Hex digest identifying the request
+        """
+        hasher = new_hasher()
+        hasher.update(image_bytes)
+        hasher.update(_prompt_key_bytes(prompt))
+        return hasher.hexdigest()
+    
+    def get(self, key: str, image_path: str = None, timestamp: str = None) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached result.
+        
+        Args:
+            key: Cache key from key()
+            image_path: Path or name of the image being processed now
+            timestamp: ISO timestamp to record instead of the current time
+        
+        Returns:
+            The cached result with a fresh timestamp (and image_path, if given), or None on a miss
+        """
+        try:
+            result = json_utils.loads(Path(self._path(key)).read_bytes())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("⚠️ Ignoring unreadable cache entry %s: %s", key, e)
+            return None
+        
+        result["timestamp"] = timestamp or datetime.now().isoformat()
+        if image_path is not None:
+            result["image_path"] = image_path
+            result["image_name"] = os.path.basename(image_path)
+        logger.debug("⚡ Using cached Gemini result (%s)", key)
+        return result
+    
+    def put(self, key: str, result: Dict[str, Any]):
+        """
+        Store a successful result.
+        
+        Args:
+            key: Cache key from key()
+            result: Result dictionary to cache
+        """
+        if result.get("processing_status") != "success":
+            return
+        
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # Write then rename so concurrent readers never see a partial entry
+            tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            Path(tmp_path).write_bytes(json_utils.dumps(result))
+            os.replace(tmp_path, self._path(key))
+        except Exception as e:
+            logger.warning("⚠️ Failed to write cache entry %s: %s", key, e)
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
@@ -0,0 +1,391 @@
+import os
+import logging
+import sqlite3
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from itertools import chain, islice
+from typing import Any, Dict, Iterator, List, Tuple
+import json_utils
+import batch_log
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the table layout changes; an index with another version is rebuilt
+SCHEMA_VERSION = 3
+
+def search_terms(img_data: Dict[str, Any]) -> Tuple[frozenset, str, str]:
+    """
+    Tokenize an image for relevance scoring.
+    
+    Returns:
+        Tuple of (set of lowercase context words, those words space-joined and
+        space-padded, lowercase image name)
+    """
+    context_words = str(img_data.get('context', '')).lower().split()
+    return frozenset(context_words), f" {' '.join(context_words)} ", str(img_data.get('image_name', '')).lower()
+
+class SearchIndex:
+    def __init__(self, output_dir: str, index_filename: str = "search_index.sqlite3", max_workers: int = 8):
+        """
+        Inverted index over the stored image analyses, kept in SQLite.
+        
+        Maps each lowercase whitespace token of an image's context to the images
+        containing it, so a query only touches images sharing a word with it
+        instead of re-reading every result file. The index is a cache: each
+        sync re-reads only files whose size or mtime changed, and only the new
+        tail of a batch log. Each image's scalar fields (status, timestamp, size,
+        format) are also kept as columns, so summaries never decode the stored JSON.
+        
+        Decoded records (and, once needed, their search terms) are kept in
+        memory by row id, so repeated queries only parse and tokenize rows
+        added since the last one.
+        """
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, index_filename)
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._records: Dict[int, Dict[str, Any]] = {}
+        self._terms: Dict[int, Tuple[frozenset, str, str]] = {}
+        # Token of the index build the cached records were decoded from
+        self._build_token: str = None
+        # (size, mtime_ns) of every file as of the last sync that finished
+        self._synced: Dict[str, Tuple[int, int]] = None
+        # Bumped by every sync that changed the index, so callers can cache query results per generation
+        self.generation = 0
+    
+    def sync(self, files: Dict[str, os.stat_result]):
+        """
+        Bring the index up to date with the given result files.
+        
+        Args:
+            files: Result files (.json and batch logs) currently in the output directory,
+                mapped to their stat results (e.g. from os.scandir)
+        """
+        current = {filename: (stat.st_size, stat.st_mtime_ns) for filename, stat in files.items()}
+        
+        with self._lock:
+            # Nothing changed since the last sync: skip opening the database at all
+            # (unless the index file itself was deleted and has to be rebuilt)
+            if current == self._synced and os.path.exists(self.path):
+                return
+            try:
+                self._sync(current, check=self._synced is None)
+            except sqlite3.OperationalError:
+                # Locked or busy rather than damaged
+                raise
+            except sqlite3.DatabaseError as e:
+                # Writes aren't synced to disk, so a crash mid-write can corrupt the file;
+                # everything in it comes from the result files, so just build it again
+                logger.warning("⚠️ Search index is damaged (%s), rebuilding it", e)
+                self._discard()
+                self._sync(current)
+            self._synced = current
+            self.generation += 1
+    
+    def _discard(self):
+        """Delete the index file and the records decoded from it (callers hold _lock)."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self._records.clear()
+        self._terms.clear()
+        self._build_token = None
+    
+    def _sync(self, current: Dict[str, Tuple[int, int]], check: bool = False):
+        """
+        Index whatever changed in the given files (callers hold _lock).
+        
+        Args:
+            current: (size, mtime_ns) of every result file
+            check: Verify the whole file first (raising sqlite3.DatabaseError if it's damaged),
+                as the first sync of a process does in case an earlier one crashed mid-write
+        """
+        with closing(self._connect()) as conn, conn:
+            if check:
+                problem = conn.execute("PRAGMA quick_check").fetchone()[0]
+                if problem != "ok":
+                    raise sqlite3.DatabaseError(problem)
+            stored = {row[0]: row[1:] for row in conn.execute("SELECT source_file, size, mtime_ns FROM sources")}
+            
+            for filename in stored.keys() - current.keys():
+                self._drop_source(conn, filename)
+            
+            pending = []
+            for filename, (size, mtime_ns) in current.items():
+                previous = stored.get(filename)
+                if previous == (size, mtime_ns):
+                    continue
+                
+                # Batch logs only ever grow, so index just the lines added since last time
+                if previous and batch_log.is_batch_log(filename) and size > previous[0]:
+                    offset = previous[0]
+                else:
+                    if previous:
+                        self._drop_source(conn, filename)
+                    offset = 0
+                pending.append((filename, offset))
+            
+            if not pending:
+                return
+            
+            # Reads are I/O bound and release the GIL, so overlap them; SQLite writes stay on this thread
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pending))) as executor:
+                loaded = list(executor.map(self._try_read_file, pending))
+            
+            for (filename, _), result in zip(pending, loaded):
+                if result is None:
+                    continue
+                records, offset = result
+                
+                for img_data, batch_id in records:
+                    self._add_record(conn, filename, batch_id, img_data)
+                
+                # For logs, remember where the last complete line ended rather than the raw size
+                size, mtime_ns = current[filename]
+                conn.execute(
+                    "INSERT OR REPLACE INTO sources (source_file, size, mtime_ns) VALUES (?, ?, ?)",
+                    (filename, offset if batch_log.is_batch_log(filename) else size, mtime_ns)
+                )
+    
+    def match_counts(self, query_words: List[str], first_file: str = None) -> List[Tuple[int, int, bool]]:
+        """
+        Count the query words found in every image that could match a query.
+        
+        An image is a candidate when one of the query words is a token of its
+        context or a substring of its lowercased name. The counts come from
+        the postings in a single SQLite query, so no stored JSON is decoded.
+        
+        Args:
+            query_words: Lowercase query words (a repeated word counts each time)
+            first_file: Result file listed before the others (the default batch log)
+        
+        Returns:
+            List of (row id, matching query words, whether a query word is in the name),
+            in file order
+        """
+        if not query_words:
+            return []
+        
+        weights = Counter(query_words)
+        values = ", ".join("(?, ?)" for _ in weights)
+        name_match = " OR ".join("instr(name_lower, ?) > 0" for _ in weights)
+        sql = (
+            f"WITH query (token, weight) AS (VALUES {values}), "
+            "hits (image_id, matching) AS ("
+            "  SELECT postings.image_id, SUM(query.weight) FROM postings JOIN query ON postings.token = query.token"
+            "  GROUP BY postings.image_id) "
+            "SELECT id, matching, name_match FROM ("
+            f"  SELECT images.id, images.source_file, COALESCE(hits.matching, 0) AS matching, ({name_match}) AS name_match"
+            "  FROM images LEFT JOIN hits ON hits.image_id = images.id) "
+            "WHERE matching > 0 OR name_match "
+            "ORDER BY source_file != ?, source_file, id"
+        )
+        params = [item for pair in weights.items() for item in pair] + list(weights) + [first_file]
+        with self._lock, closing(self._connect()) as conn:
+            return [(image_id, matching, bool(name)) for image_id, matching, name in conn.execute(sql, params)]
+    
+    def terms(self, image_ids: List[int]) -> Dict[int, Tuple[frozenset, str, str]]:
+        """Get the search_terms() of indexed images by row id."""
+        with self._lock, closing(self._connect()) as conn:
+            missing = [image_id for image_id in image_ids if image_id not in self._terms]
+            self._decode(conn, missing)
+            for image_id in missing:
+                if image_id in self._records:
+                    self._terms[image_id] = search_terms(self._records[image_id])
+            return {image_id: self._terms[image_id] for image_id in image_ids if image_id in self._terms}
+    
+    def rows(self, image_ids: List[int]) -> List[Tuple[Dict[str, Any], str, Any]]:
+        """Get indexed images by row id, as (image data, source file, batch id) in the given order."""
+        if not image_ids:
+            return []
+        placeholders = ", ".join("?" for _ in image_ids)
+        with self._lock, closing(self._connect()) as conn:
+            located = {row[0]: row[1:] for row in conn.execute(
+                f"SELECT id, source_file, batch_id FROM images WHERE id IN ({placeholders})", image_ids
+            )}
+            self._decode(conn, list(located))
+            # Callers may annotate the dicts they get, so hand out copies
+            return [(dict(self._records[image_id]), *located[image_id]) for image_id in image_ids if image_id in located]
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Summarize the indexed images from their columns alone.
+        
+        Returns:
+            Dictionary with 'total_images' plus image counts 'by_status' and 'by_format'
+        """
+        with self._lock, closing(self._connect()) as conn:
+            by_status = dict(conn.execute("SELECT COALESCE(status, 'Unknown'), COUNT(*) FROM images GROUP BY 1"))
+            by_format = dict(conn.execute("SELECT COALESCE(format, 'Unknown'), COUNT(*) FROM images GROUP BY 1"))
+        return {"total_images": sum(by_status.values()), "by_status": by_status, "by_format": by_format}
+    
+    def count(self) -> int:
+        """Number of indexed images."""
+        with self._lock, closing(self._connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+    
+    def records(self, first_file: str = None, limit: int = None) -> Iterator[Tuple[Dict[str, Any], str, Any]]:
+        """
+        Yield indexed images as (image data, source file, batch id), first_file's images first.
+        
+        Args:
+            first_file: Result file listed before the others (the default batch log)
+            limit: Stop after this many images (only those are decoded)
+        """
+        # Two walks of the source_file index rather than sorting every row to put first_file in front
+        yield from self._query(
+            ("SELECT id, source_file, batch_id FROM images WHERE source_file IS ? ORDER BY id", [first_file]),
+            ("SELECT id, source_file, batch_id FROM images WHERE source_file IS NOT ? ORDER BY source_file, id", [first_file]),
+            limit=limit
+        )
+    
+    def _try_read_file(self, item: Tuple[str, int]):
+        """Read one pending (filename, offset) pair, or return None if it can't be read."""
+        filename, offset = item
+        try:
+            return self._read_file(filename, offset)
+        except Exception as e:
+            logger.warning("⚠️ Error reading %s: %s", filename, e)
+            return None
+    
+    def _read_file(self, filename: str, offset: int = 0) -> Tuple[List[Tuple[Dict[str, Any], Any]], int]:
+        """
+        Read the image records of one result file.
+        
+        Args:
+            filename: Result file name
+            offset: Byte offset to resume a batch log from
+        
+        Returns:
+            Tuple of ([(image data, batch id), ...], offset after the last complete line)
+        """
+        filepath = os.path.join(self.output_dir, filename)
+        records = []
+        
+        # Batch log - one batch per line; only complete lines (and zstd frames) are read
+        if batch_log.is_batch_log(filename):
+            complete, next_offset = batch_log.read_tail(filepath, offset)
+            for batch_index, line in enumerate(complete.splitlines()):
+                if not line.strip():
+                    continue
+                try:
+                    batch = json_utils.loads(line)
+                except json_utils.JSONDecodeError as e:
+                    logger.warning("⚠️ Skipping unreadable line in %s: %s", filename, e)
+                    continue
+                if isinstance(batch, dict):
+                    for img_data in batch.get('images') or []:
+                        records.append((img_data, batch.get('batch_id', batch_index + 1)))
+            return records, next_offset
+        
+        data = json_utils.load_file(filepath)
+        
+        history_format = batch_log.classify_history(data)
+        
+        # Handle batch structure with 'batches' array (not yet migrated)
+        if history_format is batch_log.HistoryFormat.NEW:
+            for batch_index, batch in enumerate(data['batches']):
+                if 'images' in batch and isinstance(batch['images'], list):
+                    for img_data in batch['images']:
+                        records.append((img_data, batch.get('batch_id', batch_index + 1)))
+        
+        # Handle legacy batch structure with 'images' array
+        elif history_format is batch_log.HistoryFormat.OLD:
+            for img_data in data['images']:
+                records.append((img_data, 'Legacy'))
+        
+        else:
+            # Single image result
+            records.append((data, 'Single'))
+        
+        return records, offset
+    
+    def _query(self, *statements: Tuple[str, list], limit: int = None) -> Iterator[Tuple[Dict[str, Any], str, Any]]:
+        """Run (sql, params) queries selecting (id, source_file, batch_id) and yield the first limit records in order."""
+        with self._lock, closing(self._connect()) as conn:
+            # Cursors are consumed lazily, so SQLite stops stepping once limit rows are in
+            cursors = (conn.execute(sql, params) for sql, params in statements)
+            rows = list(islice(chain.from_iterable(cursors), limit))
+            self._decode(conn, [row[0] for row in rows])
+            # Callers may annotate the dicts they get, so hand out copies
+            records = [(dict(self._records[image_id]), source_file, batch_id) for image_id, source_file, batch_id in rows]
+        
+        yield from records
+    
+    def _decode(self, conn: sqlite3.Connection, image_ids: List[int]):
+        """Load the records of the given rows into memory (callers hold _lock)."""
+        # Only rows not decoded by an earlier query need their JSON fetched and parsed
+        missing = [image_id for image_id in image_ids if image_id not in self._records]
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            placeholders = ", ".join("?" for _ in chunk)
+            for image_id, data in conn.execute(f"SELECT id, data FROM images WHERE id IN ({placeholders})", chunk):
+                self._records[image_id] = json_utils.loads(data)
+    
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        # The index can always be rebuilt (sync does so if it finds the file damaged), and an
+        # in-memory journal keeps SQLite from creating journal files in the output directory
+        # (which would bump its mtime)
+        conn.execute("PRAGMA journal_mode = MEMORY")
+        conn.execute("PRAGMA synchronous = OFF")
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            # Older layout; the index is a cache, so start over instead of migrating it
+            conn.executescript("DROP TABLE IF EXISTS postings; DROP TABLE IF EXISTS images; DROP TABLE IF EXISTS sources; "
+                               "DROP TABLE IF EXISTS build;")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS build (token TEXT);
+            CREATE TABLE IF NOT EXISTS sources (
+                source_file TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS images (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, source_file TEXT, batch_id, name_lower TEXT,
+                status TEXT, timestamp TEXT, width INTEGER, height INTEGER, format TEXT, data BLOB
+            );
+            CREATE INDEX IF NOT EXISTS images_source ON images (source_file);
+            CREATE TABLE IF NOT EXISTS postings (
+                token TEXT, image_id INTEGER, PRIMARY KEY (token, image_id)
+            ) WITHOUT ROWID;
+        """)
+        # The app and the web server share this file. AUTOINCREMENT keeps ids from being
+        # reused after deletes, and only a rebuild (by any process) restarts them, which the
+        # build token reveals; decoded records are keyed by id, so they're dropped then
+        row = conn.execute("SELECT token FROM build").fetchone()
+        if row is None:
+            with conn:
+                conn.execute("INSERT INTO build (token) SELECT ? WHERE NOT EXISTS (SELECT 1 FROM build)", (os.urandom(8).hex(),))
+            row = conn.execute("SELECT token FROM build").fetchone()
+        token = row[0]
+        if token != self._build_token:
+            self._records.clear()
+            self._terms.clear()
+            self._build_token = token
+        return conn
+    
+    def _add_record(self, conn: sqlite3.Connection, source_file: str, batch_id: Any, img_data: Dict[str, Any]):
+        """Index one image: its metadata row plus one posting per distinct context token."""
+        size = img_data.get('image_size')
+        if not isinstance(size, dict):
+            size = {}
+        image_id = conn.execute(
+            "INSERT INTO images (source_file, batch_id, name_lower, status, timestamp, width, height, format, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (source_file, batch_id, str(img_data.get('image_name', '')).lower(),
+             img_data.get('processing_status'), img_data.get('timestamp'),
+             size.get('width'), size.get('height'), size.get('format'), json_utils.dumps(img_data))
+        ).lastrowid
+        tokens = set(str(img_data.get('context', '')).lower().split())
+        conn.executemany("INSERT OR IGNORE INTO postings (token, image_id) VALUES (?, ?)", ((token, image_id) for token in tokens))
+    
+    def _drop_source(self, conn: sqlite3.Connection, source_file: str):
+        """Remove everything indexed from one result file."""
+        for (image_id,) in conn.execute("SELECT id FROM images WHERE source_file = ?", (source_file,)):
+            self._records.pop(image_id, None)
+            self._terms.pop(image_id, None)
+        conn.execute("DELETE FROM postings WHERE image_id IN (SELECT id FROM images WHERE source_file = ?)", (source_file,))
+        conn.execute("DELETE FROM images WHERE source_file = ?", (source_file,))
+        conn.execute("DELETE FROM sources WHERE source_file = ?", (source_file,))
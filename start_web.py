@@ -6,7 +6,7 @@ Startup script for Image Context Analyzer Web Server
 import os
 import sys
 import subprocess
-import importlib
+import importlib.util
 
 def check_dependencies():
     """Check if required packages are installed."""
@@ -20,15 +20,15 @@ def check_dependencies():
     
     missing_packages = []
     
+    # Only locate the modules; importing them here would load Flask, Gemini and PIL
+    # in this process just to throw them away before web_server.py starts
     for package in required_packages:
         try:
-            if package == 'PIL':
-                importlib.import_module('PIL')
-            elif package == 'flask_cors':
-                importlib.import_module('flask_cors')
-            else:
-                importlib.import_module(package)
+            found = importlib.util.find_spec(package) is not None
         except ImportError:
+            # Parent package (e.g. google) missing
+            found = False
+        if not found:
             missing_packages.append(package)
     
     if missing_packages:
@@ -92,6 +92,13 @@ def main():
     
     try:
         # Start the web server
+        if os.name == 'posix':
+            # Become the server process rather than keeping a second interpreter waiting on it;
+            # flush first, since exec discards anything still buffered
+            sys.stdout.flush()
+            os.execv(sys.executable, [sys.executable, 'web_server.py'])
+        # Windows has no real exec (os.execv starts a new process and this one exits,
+        # detaching the server from the console), so run it as a child there
         subprocess.run([sys.executable, 'web_server.py'])
     except KeyboardInterrupt:
         print("\n👋 Web server stopped by user")
@@ -0,0 +1,106 @@
+import os
+import logging
+import sqlite3
+import threading
+from contextlib import closing
+from typing import Any, BinaryIO, Dict, Optional
+import json_utils
+from result_cache import new_hasher
+
+logger = logging.getLogger(__name__)
+
+# Read size when hashing a file before upload
+HASH_CHUNK_SIZE = 1 << 20
+
+class UploadCache:
+    def __init__(self, cache_dir: str, filename: str = "imagekit_uploads.sqlite3"):
+        """
+        Content-addressed record of the files already uploaded to ImageKit.
+        
+        Maps a hash of a file's bytes to its upload result, so uploading the
+        same image again (under any name) is answered locally instead of being
+        sent over the network. An entry is forgotten when its file is deleted
+        from ImageKit.
+        """
+        self.cache_dir = cache_dir
+        self.path = os.path.join(cache_dir, filename)
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def digest_bytes(data: bytes) -> str:
+        """Hash in-memory file contents."""
+        hasher = new_hasher()
+        hasher.update(data)
+        return hasher.hexdigest()
+    
+    @staticmethod
+    def digest_file(file: BinaryIO) -> str:
+        """Hash an open binary file in chunks, then rewind it for the upload."""
+        hasher = new_hasher()
+        buffer = bytearray(HASH_CHUNK_SIZE)
+        view = memoryview(buffer)
+        file.seek(0)
+        while True:
+            read = file.readinto(buffer)
+            if not read:
+                break
+            hasher.update(view[:read])
+        file.seek(0)
+        return hasher.hexdigest()
+    
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up an earlier upload of the same contents.
+        
+        Args:
+            digest: Content hash from digest_bytes() or digest_file()
+        
+        Returns:
+            The stored upload result, or None on a miss
+        """
+        try:
+            with self._lock, closing(self._connect()) as conn:
+                row = conn.execute("SELECT result FROM uploads WHERE digest = ?", (digest,)).fetchone()
+            return json_utils.loads(row[0]) if row else None
+        except Exception as e:
+            logger.warning("⚠️ Ignoring unreadable upload cache entry %s: %s", digest, e)
+            return None
+    
+    def put(self, digest: str, result: Dict[str, Any]):
+        """
+        Remember a successful upload.
+        
+        Args:
+            digest: Content hash of the uploaded file
+            result: Upload result dictionary (ignored unless it succeeded)
+        """
+        if not result.get("success") or not result.get("imagekit_id"):
+            return
+        
+        try:
+            with self._lock, closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO uploads (digest, imagekit_id, result) VALUES (?, ?, ?)",
+                    (digest, result["imagekit_id"], json_utils.dumps(result))
+                )
+        except Exception as e:
+            logger.warning("⚠️ Failed to write upload cache entry %s: %s", digest, e)
+    
+    def forget(self, imagekit_id: str):
+        """Drop the entries pointing at a file that was deleted from ImageKit."""
+        try:
+            with self._lock, closing(self._connect()) as conn, conn:
+                conn.execute("DELETE FROM uploads WHERE imagekit_id = ?", (imagekit_id,))
+        except Exception as e:
+            logger.warning("⚠️ Failed to update upload cache for %s: %s", imagekit_id, e)
+    
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        conn = sqlite3.connect(self.path)
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS uploads (
+                digest TEXT PRIMARY KEY, imagekit_id TEXT, result BLOB
+            );
+            CREATE INDEX IF NOT EXISTS uploads_imagekit_id ON uploads (imagekit_id);
+        """)
+        return conn
@@ -3,19 +3,72 @@
 Flask web server for Image Context Analyzer
 """
 
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, request, jsonify, render_template_string, send_file
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from werkzeug.utils import secure_filename
 import os
+import atexit
+import gzip
+import logging
+import mimetypes
+import tempfile
+import time
+from urllib.parse import quote
 from dotenv import load_dotenv
-from image_processor import ImageProcessor
-import json
+from image_processor import ImageProcessor, MAX_IMAGES_PER_REQUEST
+from imagekit_service import sniff_image_type
+from log_setup import configure_logging
+import json_utils
+import batch_log
 import base64
 from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
 
 # Load environment variables
 load_dotenv()
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# Buffer for streaming uploads to disk; memory per upload stays at this size
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Behind nginx, hand /uploads/ files back to it via X-Accel-Redirect so it sends them
+# with sendfile(2); set to the prefix of an `internal` location aliased to the uploads dir
+UPLOADS_ACCEL_PREFIX = os.getenv("UPLOADS_ACCEL_PREFIX")
+
+# JSON responses at least this large are gzipped for clients that accept it; level 4 gets
+# within a few percent of the default level's ratio at a third of the CPU
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 4
+
+# Failed requests log their traceback at most this often (seconds); formatting one
+# happens on the request thread, which adds up when an upstream outage fails every request
+TRACEBACK_INTERVAL = 1.0
+_last_traceback = 0.0
+
+# Upload names are never reused and files are never rewritten, so browsers may cache them for good
+UPLOAD_MAX_AGE = 365 * 24 * 3600
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with json_utils (orjson when installed)."""
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return json_utils.dumps(obj, indent=bool(kwargs.get('indent')), default=self.default).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return json_utils.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Same output rules as Flask's provider, but the body goes out as the encoded bytes
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        body = json_utils.dumps(obj, indent=indent, default=self.default) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)  # Enable CORS for all routes
 
 # Initialize the image processor
@@ -32,25 +85,80 @@ except Exception as e:
     print(f"❌ Error: Failed to initialize Gemini API: {str(e)}")
     exit(1)
 
+# Let background ImageKit uploads finish when the server shuts down
+atexit.register(processor.close)
+
+@lru_cache(maxsize=1)
+def _read_index_html(mtime_ns: int, size: int) -> bytes:
+    """Read index.html once per version of the file (keyed on its mtime and size)."""
+    return Path('index.html').read_bytes()
+
+@app.after_request
+def compress_json(response):
+    """Gzip large JSON responses (history, search results, downloads) when the client accepts it."""
+    if response.mimetype != 'application/json' or response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    
+    response.vary.add('Accept-Encoding')
+    if request.accept_encodings.quality('gzip') <= 0 or (response.content_length or 0) < COMPRESS_MIN_SIZE:
+        return response
+    
+    response.set_data(gzip.compress(response.get_data(), compresslevel=COMPRESS_LEVEL))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+def _is_image_upload(image_file) -> bool:
+    """Check an upload's first bytes against the supported image signatures, leaving its stream at the start."""
+    head = image_file.stream.read(12)
+    image_file.stream.seek(0)
+    return sniff_image_type(head) is not None
+
+def _safe_filename(filename: str) -> str:
+    """Client-supplied file name reduced to a plain name that can't leave the uploads directory."""
+    return secure_filename(filename) or "image"
+
+def _temp_upload_path(safe_name: str) -> str:
+    """Create an empty, uniquely named temp file in uploads for an incoming image."""
+    # Concurrent requests for the same file name must not share a temp file: its
+    # stored upload is a hardlink to it, so saving over it would rewrite that upload
+    fd, path = tempfile.mkstemp(prefix="temp_", suffix=f"_{safe_name}", dir=processor.uploads_dir)
+    os.close(fd)
+    return path
+
+def _log_request_error(message: str, error: Exception):
+    """Log a failed request from its except block, with the traceback only if none was logged recently."""
+    global _last_traceback
+    now = time.monotonic()
+    # Unlocked on purpose: a race only lets an extra traceback through
+    if now - _last_traceback >= TRACEBACK_INTERVAL:
+        _last_traceback = now
+        logger.exception(message, error)
+    else:
+        logger.error(message, error)
+
 @app.route('/')
 def index():
     """Serve the main HTML page."""
-    with open('index.html', 'r', encoding='utf-8') as f:
-        html_content = f.read()
-    
-    return html_content
+    # A stat per hit picks up edits without a restart; the contents come from memory
+    stat = os.stat('index.html')
+    response = app.response_class(_read_index_html(stat.st_mtime_ns, stat.st_size), mimetype='text/html')
+    response.set_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+    response.last_modified = stat.st_mtime
+    # Let browsers keep it but check back each time, getting a 304 while it is unchanged
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
 @app.route('/process-image', methods=['POST'])
 def process_image():
     """Process uploaded image(s) with Gemini API."""
     try:
-        print(f"🔍 Processing image request...")
+        logger.debug("🔍 Processing image request...")
         
         # Check if image files are present
         if 'images' not in request.files:
             # Fallback to single image for backward compatibility
             if 'image' not in request.files:
-                print("❌ No image files in request")
+                logger.warning("❌ No image files in request")
                 return jsonify({'error': 'No image files provided'}), 400
             
             # Handle single image
@@ -59,42 +167,59 @@ def process_image():
         # Handle multiple images
         image_files = request.files.getlist('images')
         if not image_files or all(f.filename == '' for f in image_files):
-            print("❌ No valid image files selected")
+            logger.warning("❌ No valid image files selected")
             return jsonify({'error': 'No valid image files selected'}), 400
         
-        print(f"📸 Processing {len(image_files)} images...")
+        # Reject non-images before anything is written or sent to Gemini
+        not_images = [f.filename for f in image_files if f.filename and not _is_image_upload(f)]
+        if not_images:
+            logger.warning("❌ Not image files: %s", ", ".join(not_images))
+            return jsonify({'error': f"Not a supported image (PNG, JPEG, GIF, BMP or WebP): {', '.join(not_images)}"}), 400
+        
+        logger.info("📸 Processing %s images...", len(image_files))
         
         # Get optional parameters
         custom_prompt = request.form.get('prompt', None)
-        custom_filename = request.form.get('filename', None)
+        # Names the results file in output_dir, so it gets the same sanitizing as uploads
+        custom_filename = secure_filename(request.form.get('filename', '')) or None
+        # Several images per Gemini call cuts round-trips; the response is split back per image.
+        # Capped here too, so a client can't put a whole upload into one request
+        try:
+            images_per_request = int(request.form.get('images_per_request', 1))
+        except ValueError:
+            logger.warning("❌ Invalid images_per_request: %s", request.form.get('images_per_request'))
+            return jsonify({'error': 'images_per_request must be a whole number'}), 400
+        images_per_request = min(max(1, images_per_request), MAX_IMAGES_PER_REQUEST)
         
-        print(f"📝 Custom prompt: {custom_prompt[:100] if custom_prompt else 'None'}...")
-        print(f"📁 Custom filename: {custom_filename}")
+        logger.debug("📝 Custom prompt: %s...", custom_prompt[:100] if custom_prompt else 'None')
+        logger.debug("📁 Custom filename: %s", custom_filename)
+        logger.debug("🧩 Images per request: %s", images_per_request)
         
         # Save uploaded files temporarily and copy to uploads
         temp_paths = []
         upload_paths = []
         
-        for i, image_file in enumerate(image_files):
-            if image_file.filename:
-                # Create temp file in uploads directory instead of main directory
-                temp_path = os.path.join(processor.uploads_dir, f"temp_{i}_{image_file.filename}")
-                image_file.save(temp_path)
-                temp_paths.append(temp_path)
-                
-                # Copy to uploads folder with timestamp
-                upload_path = processor.copy_image_to_uploads(temp_path)
-                upload_paths.append(upload_path)
-                
-                print(f"💾 Saved temp file {i+1}: {temp_path}")
-                print(f"📁 Copied to uploads: {upload_path}")
-        
         try:
+            for i, image_file in enumerate(image_files):
+                if image_file.filename:
+                    # Create temp file in uploads directory instead of main directory
+                    safe_name = _safe_filename(image_file.filename)
+                    temp_path = _temp_upload_path(safe_name)
+                    temp_paths.append(temp_path)
+                    image_file.save(temp_path, buffer_size=UPLOAD_CHUNK_SIZE)
+                    
+                    # Store in uploads folder with timestamp (a hardlink to the temp file when possible)
+                    upload_path = processor.copy_image_to_uploads(temp_path, safe_name)
+                    upload_paths.append(upload_path)
+                    
+                    logger.debug("💾 Saved temp file %s: %s", i + 1, temp_path)
+                    logger.debug("📁 Copied to uploads: %s", upload_path)
+            
             # Process all images with Gemini
-            print("🤖 Calling Gemini API for batch processing...")
+            logger.debug("🤖 Calling Gemini API for batch processing...")
             
-            batch_result = processor.process_multiple_images(temp_paths, custom_prompt)
-            print(f"✅ Batch processing completed. Status: {batch_result['processing_status']}")
+            batch_result = processor.process_multiple_images(temp_paths, custom_prompt, images_per_request=images_per_request)
+            logger.info("✅ Batch processing completed. Status: %s", batch_result['processing_status'])
             
             # Add upload paths to results BEFORE saving to JSON
             for i, result in enumerate(batch_result['images']):
@@ -102,16 +227,9 @@ def process_image():
                     result['upload_path'] = upload_paths[i]
             
             # Save batch results to JSON (after adding upload_paths)
-            print("💾 Saving batch results to JSON...")
+            logger.debug("💾 Saving batch results to JSON...")
             json_path = processor.save_batch_to_json(batch_result, custom_filename)
-            print(f"📁 Batch JSON saved to: {json_path}")
-            
-            # Clean up temp files from uploads directory
-            for temp_path in temp_paths:
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                    print(f"🧹 Cleaned up temp file: {temp_path}")
-            print("🧹 Temp files cleaned up")
+            logger.info("📁 Batch JSON saved to: %s", json_path)
             
             return jsonify({
                 'success': True,
@@ -121,19 +239,16 @@ def process_image():
             })
             
         except Exception as e:
-            # Clean up temp files from uploads directory even after error
-            for temp_path in temp_paths:
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                    print(f"🧹 Cleaned up temp file after error: {temp_path}")
-            print(f"🧹 Temp files cleaned up after error")
-            print(f"❌ Error during batch processing: {str(e)}")
+            logger.error("❌ Error during batch processing: %s", e)
             raise e
+        finally:
+            # Clean up temp files from uploads directory, whatever happened
+            for temp_path in temp_paths:
+                Path(temp_path).unlink(missing_ok=True)
+            logger.debug("🧹 Temp files cleaned up")
             
     except Exception as e:
-        print(f"❌ Fatal error in process_image: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        _log_request_error("❌ Fatal error in process_image: %s", e)
         
         # Ensure we have a complete error structure
         error_result = {
@@ -156,52 +271,53 @@ def process_single_image(request):
         image_file = request.files['image']
         if image_file.filename == '':
             return jsonify({'error': 'No image file selected'}), 400
+        if not _is_image_upload(image_file):
+            logger.warning("❌ Not an image file: %s", image_file.filename)
+            return jsonify({'error': 'Not a supported image (PNG, JPEG, GIF, BMP or WebP)'}), 400
         
-        print(f"📸 Processing single image: {image_file.filename}")
+        logger.info("📸 Processing single image: %s", image_file.filename)
         
         # Get optional parameters
         custom_prompt = request.form.get('prompt', None)
-        custom_filename = request.form.get('filename', None)
+        # Names the results file in output_dir, so it gets the same sanitizing as uploads
+        custom_filename = secure_filename(request.form.get('filename', '')) or None
         
         # Save uploaded file temporarily in uploads directory
-        temp_path = os.path.join(processor.uploads_dir, f"temp_{image_file.filename}")
-        image_file.save(temp_path)
-        print(f"💾 Saved temp file: {temp_path}")
-        
-        # Copy to uploads folder with timestamp
-        upload_path = processor.copy_image_to_uploads(temp_path)
-        
-        # Test if image can be opened
-        try:
-            from PIL import Image
-            test_image = Image.open(temp_path)
-            print(f"   Image test: {test_image.format} {test_image.size} {test_image.mode}")
-            test_image.close()
-        except Exception as img_error:
-            print(f"   ⚠️ Image test failed: {str(img_error)}")
+        safe_name = _safe_filename(image_file.filename)
+        temp_path = _temp_upload_path(safe_name)
         
         try:
+            image_file.save(temp_path, buffer_size=UPLOAD_CHUNK_SIZE)
+            logger.debug("💾 Saved temp file: %s", temp_path)
+            
+            # Store in uploads folder with timestamp (a hardlink to the temp file when possible)
+            upload_path = processor.copy_image_to_uploads(temp_path, safe_name)
+            
+            # Test if image can be opened
+            try:
+                from PIL import Image
+                with Image.open(temp_path) as test_image:
+                    logger.debug("   Image test: %s %s %s", test_image.format, test_image.size, test_image.mode)
+            except Exception as img_error:
+                logger.warning("⚠️ Image test failed: %s", img_error)
+            
             # Process image with Gemini
-            print("🤖 Calling Gemini API...")
-            print(f"   Temp file: {temp_path}")
-            print(f"   File size: {os.path.getsize(temp_path)} bytes")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("🤖 Calling Gemini API...")
+                logger.debug("   Temp file: %s", temp_path)
+                logger.debug("   File size: %s bytes", os.path.getsize(temp_path))
             
             result = processor.process_image(temp_path, custom_prompt)
-            print(f"✅ Gemini processing completed. Status: {result['processing_status']}")
+            logger.info("✅ Gemini processing completed. Status: %s", result['processing_status'])
             
             if result["processing_status"] == "success":
                 # Add upload path to result BEFORE saving to JSON
                 result['upload_path'] = upload_path
                 
                 # Save to JSON
-                print("💾 Saving to JSON...")
+                logger.debug("💾 Saving to JSON...")
                 json_path = processor.save_to_json(result, custom_filename)
-                print(f"📁 JSON saved to: {json_path}")
-                
-                # Clean up temp file from uploads directory
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                    print("🧹 Temp file cleaned up")
+                logger.info("📁 JSON saved to: %s", json_path)
                 
                 return jsonify({
                     'success': True,
@@ -213,11 +329,7 @@ def process_single_image(request):
                 # Add upload path to result even for failures
                 result['upload_path'] = upload_path
                 
-                # Clean up temp file from uploads directory
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                    print("🧹 Temp file cleaned up")
-                print(f"❌ Processing failed: {result.get('error', 'Unknown error')}")
+                logger.error("❌ Processing failed: %s", result.get('error', 'Unknown error'))
                 
                 # Ensure we have a complete result structure even for failures
                 error_result = {
@@ -229,15 +341,15 @@ def process_single_image(request):
                 return jsonify(error_result), 500
         
         except Exception as e:
-            # Clean up temp file from uploads directory even after error
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-                print(f"🧹 Cleaned up temp file after error")
-            print(f"❌ Error during processing: {str(e)}")
+            logger.error("❌ Error during processing: %s", e)
             raise e
+        finally:
+            # Clean up temp file from uploads directory, whatever happened
+            Path(temp_path).unlink(missing_ok=True)
+            logger.debug("🧹 Temp file cleaned up")
             
     except Exception as e:
-        print(f"❌ Error in single image processing: {str(e)}")
+        logger.error("❌ Error in single image processing: %s", e)
         raise e
 
 @app.route('/history')
@@ -255,16 +367,53 @@ def get_history():
             'error': str(e)
         }), 500
 
+@app.route('/stats')
+def get_stats():
+    """Get counts of the processed images by status and format, and ImageKit request latencies."""
+    try:
+        return jsonify({
+            'success': True,
+            'stats': processor.get_image_stats(),
+            'imagekit_latency': processor.imagekit_service.get_latency_stats() if processor.imagekit_service else None
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/download/<filename>')
 def download_json(filename):
-    """Download a specific JSON file."""
+    """
+    Download a specific JSON file.
+    
+    By default the document comes back as a string inside {success, content, filename}.
+    With ?raw=1 the response body is the document itself, streamed rather than built in
+    memory (plain JSON files also get conditional and range requests).
+    """
     try:
         file_path = os.path.join(processor.output_dir, filename)
-        if not os.path.exists(file_path):
-            return jsonify({'error': 'File not found'}), 404
+        raw = request.args.get('raw') == '1'
         
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        # Batch history is stored as a (possibly compressed) .jsonl log; serve it (and its
+        # old .json name) as the single {batches, ...} document the frontend expects
+        log_path = processor.batch_log_path(filename)
+        log_filename = os.path.basename(log_path)
+        if batch_log.is_batch_log(filename) or (not os.path.exists(file_path) and os.path.exists(log_path)):
+            if not os.path.exists(log_path):
+                return jsonify({'error': 'File not found'}), 404
+            if raw:
+                return app.response_class(processor.iter_batch_history_json(log_filename), mimetype='application/json')
+            history = processor.load_batch_history(log_filename)
+            content = json_utils.dumps(history, indent=True).decode('utf-8')
+        else:
+            try:
+                if raw:
+                    return send_file(file_path, mimetype='application/json', conditional=True)
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+            except FileNotFoundError:
+                return jsonify({'error': 'File not found'}), 404
         
         return jsonify({
             'success': True,
@@ -306,7 +455,7 @@ def search_images():
         search_query = data['query']
         max_results = data.get('max_results', 5)
         
-        print(f"🔍 Search request: '{search_query}' (max: {max_results})")
+        logger.info("🔍 Search request: '%s' (max: %s)", search_query, max_results)
         
         # Perform search
         search_results = processor.search_images_by_description(search_query, max_results)
@@ -314,15 +463,15 @@ def search_images():
         # Check if images exist in uploads folder
         for result in search_results:
             upload_path = result.get('upload_path', '')
-            print(f"🔍 Search result: {result.get('image_name', 'Unknown')} - upload_path: {upload_path}")
+            logger.debug("🔍 Search result: %s - upload_path: %s", result.get('image_name', 'Unknown'), upload_path)
             if upload_path and os.path.exists(upload_path):
                 result['image_exists'] = True
                 result['image_url'] = f'/uploads/{os.path.basename(upload_path)}'
-                print(f"✅ Image exists: {result['image_url']}")
+                logger.debug("✅ Image exists: %s", result['image_url'])
             else:
                 result['image_exists'] = False
                 result['image_url'] = None
-                print(f"❌ Image not found: {upload_path}")
+                logger.debug("❌ Image not found: %s", upload_path)
         
         return jsonify({
             'success': True,
@@ -332,9 +481,7 @@ def search_images():
         })
         
     except Exception as e:
-        print(f"❌ Error during search: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        _log_request_error("❌ Error during search: %s", e)
         
         return jsonify({
             'success': False,
@@ -346,11 +493,20 @@ def serve_uploaded_image(filename):
     """Serve uploaded images."""
     try:
         upload_path = os.path.join(processor.uploads_dir, filename)
-        if os.path.exists(upload_path):
-            from flask import send_file
-            return send_file(upload_path)
+        
+        if UPLOADS_ACCEL_PREFIX:
+            # nginx serves the body (or its own 404); it keeps the headers set here
+            response = app.response_class(mimetype=mimetypes.guess_type(filename)[0])
+            response.headers['X-Accel-Redirect'] = UPLOADS_ACCEL_PREFIX.rstrip('/') + '/' + quote(filename)
+            response.cache_control.public = True
+            response.cache_control.max_age = UPLOAD_MAX_AGE
         else:
-            return jsonify({'error': 'Image not found'}), 404
+            # send_file stats the file anyway, so a missing one surfaces here without a separate check
+            response = send_file(upload_path, max_age=UPLOAD_MAX_AGE)
+        response.cache_control.immutable = True
+        return response
+    except FileNotFoundError:
+        return jsonify({'error': 'Image not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -363,6 +519,7 @@ if __name__ == '__main__':
     print("   - POST /search        - Search images by description")
     print("   - GET  /uploads/<file> - Serve uploaded images")
     print("   - GET  /history       - Get processing history")
+    print("   - GET  /stats         - Image counts and ImageKit latencies")
     print("   - GET  /health        - Health check")
     print("   - GET  /test          - Test endpoint")
     
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""
+WSGI entry point for serving the Image Context Analyzer with a production server.
+
+Run with one worker process and a thread pool, e.g.:
+
+    gunicorn --worker-class gthread --workers 1 --threads 16 --bind 0.0.0.0:5000 wsgi:app
+
+A single worker keeps one ImageProcessor, so batch log appends stay serialized
+by its lock and the Gemini event loop is shared; request handlers mostly wait
+on network I/O, which releases the GIL, so threads give the concurrency.
+"""
+
+from web_server import app
+
+__all__ = ["app"]